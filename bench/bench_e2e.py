@@ -0,0 +1,179 @@
+# End-to-end update/install/upgrade of N manifests against the stub server, as JSON.
+#   python bench/bench_e2e.py [-n 50] [--size 1048576] [--latency 0.05] [--bandwidth 0]
+#       [--no-ranges] [--errors 0] [--truncate 0] [--quota 0] [--quota-limit 60]
+#       [--segments 0] [--engine process]
+#       [--output results.json] [--compare previous.json]
+import argparse
+import importlib
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import orjson
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bench.stub_server import StubServer
+
+try:
+    import resource
+except ImportError:
+    # no rusage on Windows, peak RSS and worker CPU are left out
+    resource = None
+
+# (phase, command), the version is bumped before update-new
+PHASES = [
+    ("update", "update"),
+    ("install", "install"),
+    ("update-cached", "update"),
+    ("update-new", "update"),
+    ("upgrade", "upgrade"),
+]
+
+MANIFEST_TEMPLATE = """\
+github_repo = "stub/{name}"
+regex_asset = '^.+\\.jar$'
+save_name = "{{name}}.jar"
+"""
+
+
+def peak_rss(usage) -> int:
+    # bytes, ru_maxrss is in KiB on Linux and in bytes on macOS
+    return usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+
+
+def run_phase(command: str, scripts: list[Path], config: dict, engine: str, verbose: bool, start_method: str, queue: multiprocessing.Queue):
+    # one command in a fresh process, the way the cli runs it; a spawned child would start
+    # its worker pools with spawn too, the cli uses the platform default (fork on Linux)
+    multiprocessing.set_start_method(start_method, force=True)
+    if not verbose:
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+    do = getattr(importlib.import_module(f"cmd_{command}"), f"do_{command}")
+
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    try:
+        failed = len(do(scripts, config, [], engine, None, True))
+    except SystemExit:
+        failed = len(scripts)
+    cpu, wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+
+    result = {"wall": wall, "parent_cpu": cpu, "failed": failed}
+    if resource is not None:
+        # workers are reaped when the command's pool shuts down
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        result["worker_cpu"] = children.ru_utime + children.ru_stime
+        result["parent_rss"] = peak_rss(resource.getrusage(resource.RUSAGE_SELF))
+        result["worker_rss"] = peak_rss(children)
+    queue.put(result)
+
+
+def git_commit() -> str | None:
+    result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+
+def compare(results: dict, path: Path):
+    with open(path, "rb") as f:
+        data = orjson.loads(f.read())
+    baseline = {x["phase"]: x for x in data["phases"]}
+    print(f"against {path} ({data['commit']}):")
+    for phase in results["phases"]:
+        old = baseline.get(phase["phase"])
+        if old is None:
+            continue
+        ratios = [f"{key}={phase[key] / old[key]:.2f}x" for key in ("wall", "parent_cpu") if old.get(key)]
+        print(f"  {phase['phase']:<14} {' '.join(ratios)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=50, help="number of scripts")
+    parser.add_argument("--size", type=int, default=1 << 20, help="asset size in bytes")
+    parser.add_argument("--latency", type=float, default=0.05, help="stub response latency in seconds")
+    parser.add_argument("--bandwidth", type=int, default=0, help="bytes/s per connection, 0 = unlimited")
+    parser.add_argument("--no-ranges", action="store_true", help="serve assets without Range support")
+    parser.add_argument("--errors", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--truncate", type=float, default=0.0, help="fraction of asset bodies cut in half")
+    parser.add_argument("--quota", type=int, default=0, help="GitHub quota left at the start, 0 = no rate-limit headers")
+    parser.add_argument("--quota-limit", type=int, default=None, help="X-RateLimit-Limit reported with --quota, defaults to it")
+    parser.add_argument("--segments", type=int, default=0, help="segmented downloads with this many ranges")
+    parser.add_argument("--engine", type=str, default="process", choices=("process", "async"))
+    parser.add_argument("--workers", type=int, default=4, help="update/install/upgrade workers")
+    parser.add_argument("--output", type=Path, default=None, help="write the results as JSON")
+    parser.add_argument("--compare", type=Path, default=None, help="results JSON of an earlier run")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show the commands' output")
+    args = parser.parse_args()
+
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "params": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()},
+        "phases": [],
+    }
+    server = StubServer(
+        latency=args.latency,
+        asset_size=args.size,
+        bandwidth=args.bandwidth,
+        ranges=not args.no_ranges,
+        errors=args.errors,
+        truncate=args.truncate,
+        quota=args.quota,
+        quota_limit=args.quota_limit,
+    )
+    with server, tempfile.TemporaryDirectory() as tmp:
+        home = Path(tmp)
+        (home / "scripts").mkdir()
+        scripts = []
+        for i in range(args.n):
+            path = home / "scripts" / f"stub-{i:03}.toml"
+            manifest = MANIFEST_TEMPLATE.format(name=path.stem)
+            if args.segments > 0:
+                manifest += f"segments = {args.segments}\nsegment_min_size = 0\n"
+            path.write_text(manifest)
+            scripts.append(path)
+        config = {
+            "path": {"data": str(home / "data"), "home": str(home)},
+            "worker": {"update": args.workers, "install": args.workers, "upgrade": args.workers},
+            "github": {"api_url": server.url},
+            "http": {"backoff": 0.05, "backoff_max": 1.0},
+        }
+
+        start_method = multiprocessing.get_start_method()
+        ctx = multiprocessing.get_context("spawn")
+        for phase, command in PHASES:
+            if phase == "update-new":
+                server.version = "1.0.1"
+            before = server.snapshot()
+            queue = ctx.Queue()
+            process = ctx.Process(target=run_phase, args=(command, scripts, config, args.engine, args.verbose, start_method, queue))
+            process.start()
+            result = queue.get()
+            process.join()
+            after = server.snapshot()
+            result = {"phase": phase, "command": command, **result}
+            result["requests"] = after["api"] + after["assets"] - before["api"] - before["assets"]
+            result.update({k: after[k] - before[k] for k in after})
+            results["phases"].append(result)
+
+    for x in results["phases"]:
+        rss = f" rss={x['parent_rss'] / 1e6:.0f}/{x['worker_rss'] / 1e6:.0f}MB" if "parent_rss" in x else ""
+        print(
+            f"{x['phase']:<14} wall={x['wall']:.3f}s parent_cpu={x['parent_cpu']:.3f}s{rss} "
+            f"requests={x['requests']} bytes={x['bytes']} failed={x['failed']}"
+        )
+    if args.compare is not None:
+        compare(results, args.compare)
+    if args.output is not None:
+        with open(args.output, "wb") as f:
+            f.write(orjson.dumps(results, option=orjson.OPT_INDENT_2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# Parent-process CPU time of `update` for N stub scripts.
+#   python bench/bench_scheduler.py [-n 50] [--latency 0.05]
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench.stub_server import StubServer
+from cmd_update import do_update
+
+SCRIPT_TEMPLATE = """\
+from pathlib import Path
+
+from lib.helper import client
+
+
+def update(_p_stats: dict, task_id: int, script: Path, config: dict, cache: dict):
+    _p_stats[task_id] = (0, 1)
+    data = client.get("{url}/repos/stub/{name}/releases/latest").json()
+    cache["remote_version"] = data["tag_name"].lstrip("v")
+    cache["download_url"] = data["assets"][0]["browser_download_url"]
+    cache.save()
+    _p_stats[task_id] = (1, 1)
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=50, help="number of scripts")
+    parser.add_argument("--latency", type=float, default=0.05, help="stub response latency in seconds")
+    parser.add_argument("--workers", type=int, default=4, help="update workers")
+    args = parser.parse_args()
+
+    with StubServer(latency=args.latency) as server, tempfile.TemporaryDirectory() as tmp:
+        home = Path(tmp)
+        (home / "scripts").mkdir()
+        scripts = []
+        for i in range(args.n):
+            name = f"stub-{i:03}"
+            path = home / "scripts" / f"{name}.py"
+            path.write_text(SCRIPT_TEMPLATE.format(url=server.url, name=name))
+            scripts.append(path)
+        config = {
+            "path": {"data": str(home / "data"), "home": str(home)},
+            "worker": {"update": args.workers},
+        }
+
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        do_update(scripts, config, [])
+        cpu, wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+
+    print(f"scripts={args.n} workers={args.workers} latency={args.latency}s")
+    print(f"wall={wall:.3f}s parent_cpu={cpu:.3f}s ({cpu / wall:.1%} of one core)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# Cold-interpreter startup of a command, and the imports that dominate it.
+#   python bench/bench_startup.py [-n 10] [--top 10] [--command list]
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def run(argv: list[str], importtime: bool = False) -> subprocess.CompletedProcess:
+    flags = ["-X", "importtime"] if importtime else []
+    return subprocess.run([sys.executable, *flags, str(ROOT / "main.py"), *argv], capture_output=True, text=True)
+
+
+def parse_importtime(stderr: str) -> list[tuple[int, str]]:
+    # (cumulative us, module) of the top-level imports, those with no indent
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit() or name.startswith("  "):
+            continue
+        imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=10, help="runs, the fastest and the median are reported")
+    parser.add_argument("--top", type=int, default=10, help="top-level imports to show")
+    parser.add_argument("--command", type=str, default="list", help="command to start")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        home = Path(tmp)
+        (home / "scripts").mkdir()
+        for path in (ROOT / "scripts").iterdir():
+            if path.is_file():
+                (home / "scripts" / path.name).write_bytes(path.read_bytes())
+        config = home / "config.toml"
+        config.write_text(f'[path]\ndata = "{(home / "data").as_posix()}"\nhome = "{home.as_posix()}"\n[worker]\n[script]\nenabled = []\n')
+        argv = ["-c", str(config), args.command]
+
+        # the bare interpreter is the floor no restructuring of imports gets below
+        times = {"python": [], args.command: []}
+        for _ in range(args.n):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", "pass"])
+            times["python"].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            result = run(argv)
+            times[args.command].append(time.perf_counter() - start)
+            if result.returncode != 0:
+                sys.exit(result.stderr)
+        imports = parse_importtime(run(argv, importtime=True).stderr)
+
+    for name, samples in times.items():
+        print(f"{name:<10} min={min(samples) * 1000:.1f}ms median={statistics.median(samples) * 1000:.1f}ms")
+    print(f"top-level imports of {args.command} (cumulative):")
+    for cumulative, name in imports[: args.top]:
+        print(f"  {cumulative / 1000:>7.1f}ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
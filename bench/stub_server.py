@@ -0,0 +1,225 @@
+import hashlib
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import orjson
+
+# bytes written per chunk of a throttled body
+CHUNK = 16 * 1024
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server: "StubServer"
+    # keep-alive, every response sets Content-Length
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def write(self, body: bytes, limit: int | None = None):
+        # limit cuts the body short after that many bytes and drops the connection
+        if self.command == "HEAD":
+            return
+        if limit is not None:
+            body = body[:limit]
+            self.close_connection = True
+        bandwidth = self.server.bandwidth
+        if bandwidth <= 0:
+            self.wfile.write(body)
+            self.server.count("bytes", len(body))
+            return
+        # pace each connection to the bandwidth
+        start = time.perf_counter()
+        for i in range(0, len(body), CHUNK):
+            chunk = body[i : i + CHUNK]
+            self.wfile.write(chunk)
+            self.server.count("bytes", len(chunk))
+            delay = start + (i + len(chunk)) / bandwidth - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    def send_quota(self, headers: dict | None = None):
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+
+    def send_empty(self, status: int, headers: dict | None = None):
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        # /repos/<owner>/<repo>/releases/latest
+        parts = self.path.split("?")[0].strip("/").split("/")
+        if len(parts) == 5 and parts[0] == "repos" and parts[3:] == ["releases", "latest"]:
+            self.server.count("api")
+            if self.server.inject("errors"):
+                self.send_empty(503)
+                return
+            repo = parts[2]
+            version = self.server.version
+            etag = f'"{version}"'
+            if self.headers.get("If-None-Match") == etag:
+                # like GitHub, a 304 reports the quota without using it
+                self.server.count("not_modified")
+                self.send_empty(304, {"ETag": etag, **self.server.quota(False)})
+                return
+            quota = self.server.quota(True)
+            if quota.get("X-RateLimit-Remaining") == "0" and self.server.used > self.server.quota_start:
+                self.server.count("rate_limited")
+                self.send_empty(403, quota)
+                return
+            name = f"{repo}-{version}.jar"
+            body = orjson.dumps(
+                {
+                    "tag_name": f"v{version}",
+                    "assets": [
+                        {
+                            "name": name,
+                            "browser_download_url": f"{self.server.url}/assets/{name}",
+                            "digest": f"sha256:{self.server.asset_digest(name)}",
+                        }
+                    ],
+                }
+            )
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("ETag", etag)
+            self.send_quota(quota)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.write(body)
+            return
+        if len(parts) == 2 and parts[0] == "assets":
+            self.server.count("assets")
+            if self.server.inject("errors"):
+                self.send_empty(503)
+                return
+            asset = self.server.asset_body(parts[1])
+            etag = f'"{self.server.asset_digest(parts[1])[:16]}"'
+            start, end = 0, len(asset) - 1
+            ranged = self.server.ranges and self.headers.get("Range", "").startswith("bytes=") and self.headers.get("If-Range", etag) == etag
+            if ranged:
+                self.server.count("ranges")
+                first, _, last = self.headers["Range"][6:].partition("-")
+                start, end = int(first), int(last) if last else end
+            self.send_response(206 if ranged else 200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(end - start + 1))
+            if self.server.ranges:
+                self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", etag)
+            if ranged:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{len(asset)}")
+            self.end_headers()
+            body = asset[start : end + 1]
+            truncated = self.command == "GET" and self.server.inject("truncate")
+            self.write(body, len(body) // 2 if truncated else None)
+            return
+        self.send_empty(404)
+
+
+class StubServer(ThreadingHTTPServer):
+    """GitHub's REST release lookup and asset downloads, served locally for benchmarks.
+
+    Every repo's latest release is `version`, with one asset whose content is unique to the
+    repo and version. `latency` delays every response, `bandwidth` (bytes/s per connection,
+    0 = unlimited) paces bodies, `ranges` toggles Range support, and `errors`/`truncate` are
+    the fractions of requests answered with a 503 or an asset body cut in half. With `quota`,
+    release lookups report GitHub's X-RateLimit-* headers, starting at that many remaining of
+    `quota_limit` (default `quota`) until a reset `quota_window` seconds out; lookups past it
+    get a 403.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        version: str = "1.0.0",
+        asset_size: int = 1 << 20,
+        bandwidth: int = 0,
+        ranges: bool = True,
+        errors: float = 0.0,
+        truncate: float = 0.0,
+        seed: int = 0,
+        quota: int = 0,
+        quota_limit: int | None = None,
+        quota_window: float = 3600,
+    ):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.latency = latency
+        self.version = version
+        self.bandwidth = bandwidth
+        self.ranges = ranges
+        self.rates = {"errors": errors, "truncate": truncate}
+        self.quota_start = quota
+        self.quota_limit = quota_limit or quota
+        self.quota_reset = time.time() + quota_window
+        self.used = 0
+        self.asset = bytes(i % 251 for i in range(asset_size))
+        self.url = f"http://127.0.0.1:{self.server_address[1]}"
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        # requests by kind, body bytes sent and failures injected
+        self.counters = dict.fromkeys(("api", "assets", "not_modified", "ranges", "bytes", "errors", "truncate", "rate_limited"), 0)
+        self.digests = {}
+
+    def count(self, name: str, n: int = 1):
+        with self.lock:
+            self.counters[name] += n
+
+    def inject(self, name: str) -> bool:
+        with self.lock:
+            hit = self.random.random() < self.rates[name]
+        if hit:
+            self.count(name)
+        return hit
+
+    def quota(self, use: bool) -> dict:
+        # X-RateLimit-* headers of a release lookup, `use` counts it against the quota
+        if self.quota_start <= 0:
+            return {}
+        with self.lock:
+            if use:
+                self.used += 1
+            remaining = max(self.quota_start - self.used, 0)
+        return {
+            "X-RateLimit-Limit": str(self.quota_limit),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": str(int(self.quota_reset)),
+        }
+
+    def asset_body(self, name: str) -> bytes:
+        # the shared pattern behind a per-asset prefix, so no two assets have the same digest
+        prefix = name.encode()[: len(self.asset)]
+        return prefix + self.asset[len(prefix) :]
+
+    def asset_digest(self, name: str) -> str:
+        with self.lock:
+            digest = self.digests.get(name)
+        if digest is None:
+            digest = hashlib.sha256(self.asset_body(name)).hexdigest()
+            with self.lock:
+                self.digests[name] = digest
+        return digest
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return dict(self.counters)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,290 @@
+import random
+import re
+import signal
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import orjson
+
+from cmd_update import do_update
+from cmd_upgrade import do_upgrade
+from lib.executor import WorkerPool
+from lib.helper import is_current, load_caches, load_script
+from lib.log import log, log_list, log_title
+from lib.report import current_report
+from lib.spans import current_profile, log_spans
+
+# seconds between two checks of a script, a script or manifest can set its own `interval`
+INTERVAL = 3600
+# each next check is interval * (1 +- jitter)
+JITTER = 0.1
+# the first checks are spread over this many seconds, so hosts started together do not line up
+SPLAY = 60
+# scripts due within this many seconds share a cycle, at most the script's jitter
+BATCH = 5
+# longest sleep of the scheduler, the health check fails once it missed a few
+TICK = 30
+# a running cycle counts as healthy for this many seconds, e.g. large downloads on a slow link
+CYCLE_TIMEOUT = 3600
+POLICIES = ("off", "patch", "minor", "all")
+
+
+def script_interval(script: Path, config: dict) -> float:
+    return getattr(load_script(script), "interval", config.get("daemon", {}).get("interval", INTERVAL))
+
+
+def version_parts(version: str) -> list[int] | None:
+    parts = re.findall(r"\d+", version or "")
+    return [int(x) for x in parts] if len(parts) > 0 else None
+
+
+def allowed(policy: str, installed: str, remote: str) -> bool:
+    # patch keeps major.minor, minor keeps major; versions without numbers only go with all
+    if policy == "all":
+        return True
+    if policy == "off":
+        return False
+    old, new = version_parts(installed), version_parts(remote)
+    if old is None or new is None:
+        return False
+    keep = 2 if policy == "patch" else 1
+    return (old + [0, 0])[:keep] == (new + [0, 0])[:keep]
+
+
+class ScriptState:
+    __slots__ = ("interval", "next_check", "last_check", "installed", "remote", "upgraded", "error")
+
+    def __init__(self, interval: float, next_check: float):
+        self.interval = interval
+        self.next_check = next_check
+        self.last_check = None
+        self.installed = None
+        self.remote = None
+        self.upgraded = None
+        self.error = None
+
+
+class Daemon:
+    """Polls every script on its own jittered interval, with the worker pool kept warm between checks.
+
+    Due scripts are updated together (conditional requests through the cached ETags), and
+    the ones with a newer release are upgraded when `[daemon] upgrade` allows it. `status()`
+    is what the status endpoint serves.
+    """
+
+    def __init__(self, scripts: list[Path], config: dict, engine: str, pool: WorkerPool, profile: bool = False):
+        self.config = config
+        self.engine = engine
+        self.pool = pool
+        self.profile = profile
+        self.policy = config.get("daemon", {}).get("upgrade", "off")
+        if self.policy not in POLICIES:
+            raise Exception(f"[daemon] upgrade must be one of {POLICIES}, not {self.policy}")
+        self.hold = config.get("daemon", {}).get("hold", [])
+        self.jitter = config.get("daemon", {}).get("jitter", JITTER)
+        self.started = time.time()
+        self.heartbeat = time.time()
+        self.cycle_timeout = config.get("daemon", {}).get("cycle_timeout", CYCLE_TIMEOUT)
+        self.cycle_started = None
+        self.cycles = 0
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+        splay = config.get("daemon", {}).get("splay", SPLAY)
+        now = time.time()
+        self.scripts = {x: ScriptState(script_interval(x, config), now + random.uniform(0, splay)) for x in scripts}
+
+    def schedule(self, state: ScriptState, now: float):
+        state.next_check = now + state.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def ready(self, state: ScriptState) -> float:
+        # when a script may join a cycle, never before the shortest wait its schedule allows
+        return state.next_check - min(BATCH, state.interval * self.jitter)
+
+    def due(self, now: float) -> list[Path]:
+        return [x for x, state in self.scripts.items() if self.ready(state) <= now]
+
+    def cycle(self, scripts: list[Path]):
+        # a failing command only fails this cycle, the scripts are checked again next time
+        failed = {}
+        try:
+            errors = do_update(scripts, self.config, [], self.engine, self.pool, True)
+            failed.update({x.script: x for x in errors if hasattr(x, "script")})
+        except SystemExit:
+            failed.update(dict.fromkeys(scripts, "update failed"))
+
+        caches = load_caches(scripts, self.config)
+        upgrades = []
+        for script in scripts:
+            installed, remote = self.installed_version(script), caches[script]["remote_version"]
+            with self.lock:
+                state = self.scripts[script]
+                state.last_check, state.installed, state.remote = time.time(), installed, remote
+                state.error = str(failed[script]) if script in failed else None
+            # only installed scripts are upgraded, `install` stays a manual step
+            if script in failed or installed is None or remote is None or is_current(caches[script], installed, remote):
+                continue
+            if script.stem not in self.hold and allowed(self.policy, installed, remote):
+                upgrades.append(script)
+
+        if len(upgrades) > 0:
+            try:
+                errors = do_upgrade(upgrades, self.config, [], self.engine, self.pool, True)
+                failed.update({x.script: x for x in errors if hasattr(x, "script")})
+            except SystemExit:
+                failed.update(dict.fromkeys(upgrades, "upgrade failed"))
+            for script in upgrades:
+                with self.lock:
+                    state = self.scripts[script]
+                    if script in failed:
+                        state.error = str(failed[script])
+                    else:
+                        state.installed, state.upgraded = self.installed_version(script), time.time()
+
+        now = time.time()
+        with self.lock:
+            for script in scripts:
+                self.schedule(self.scripts[script], now)
+            self.cycles += 1
+        self.publish(1 if len(failed) > 0 else 0)
+
+    def installed_version(self, script: Path) -> str | None:
+        path_latest = Path(self.config["path"]["data"]) / f"{script.stem}/latest"
+        return path_latest.resolve().name if path_latest.exists() else None
+
+    def publish(self, code: int):
+        # the report and timing table of a cycle are written when it ends, the next cycle starts
+        # with no spans, so they do not pile up over the life of the daemon
+        report, profile = current_report(), current_profile()
+        if profile is None:
+            return
+        if report is not None:
+            report.finish(profile.spans, code)
+            report.reset()
+        if self.profile:
+            log_spans(profile, f"trace-{self.cycles}.json")
+        with profile.lock:
+            profile.spans = []
+
+    def run(self):
+        while not self.stop.is_set():
+            now = time.time()
+            self.heartbeat = now
+            scripts = self.due(now)
+            if len(scripts) > 0:
+                self.cycle_started = now
+                try:
+                    self.cycle(scripts)
+                finally:
+                    self.cycle_started = None
+                continue
+            wait = min(self.ready(x) for x in self.scripts.values()) - now
+            self.stop.wait(min(wait, TICK))
+
+    def healthy(self, now: float) -> bool:
+        # the scheduler wakes at least every TICK seconds, unless a cycle is still running
+        if self.cycles == 0 or now - self.heartbeat < TICK * 3:
+            return True
+        started = self.cycle_started
+        return started is not None and now - started < self.cycle_timeout
+
+    def status(self) -> dict:
+        now = time.time()
+        with self.lock:
+            scripts = {
+                x.stem: {
+                    "installed": state.installed,
+                    "remote": state.remote,
+                    "interval": state.interval,
+                    "last_check": state.last_check,
+                    "next_check": round(state.next_check, 3),
+                    "upgraded": state.upgraded,
+                    "error": state.error,
+                }
+                for x, state in self.scripts.items()
+            }
+        return {
+            "healthy": self.healthy(now),
+            "cycle_started": self.cycle_started,
+            "started": self.started,
+            "uptime": round(now - self.started, 3),
+            "cycles": self.cycles,
+            "policy": self.policy,
+            "failed": sum(1 for x in scripts.values() if x["error"] is not None),
+            "scripts": scripts,
+        }
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+    server: "StatusServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        # /health for liveness checks, /status for everything the daemon knows
+        path = self.path.split("?")[0].rstrip("/")
+        if path not in ("/health", "/status"):
+            self.send_error(404)
+            return
+        status = self.server.daemon.status()
+        data = status if path == "/status" else {"healthy": status["healthy"], "cycles": status["cycles"], "failed": status["failed"]}
+        body = orjson.dumps(data)
+        self.send_response(200 if status["healthy"] else 503)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StatusServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: str, daemon: Daemon):
+        host, _, port = address.rpartition(":")
+        super().__init__((host or "127.0.0.1", int(port)), StatusHandler)
+        self.daemon = daemon
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+def do_daemon(scripts: list[Path], config: dict, args: list[str], engine: str = "process", pool: WorkerPool | None = None, profile: bool = False):
+    try:
+        if pool is None:
+            raise Exception("daemon needs the worker pool, run it on its own, e.g. `mapo daemon`")
+        if len(scripts) == 0:
+            raise Exception("No enabled scripts to watch")
+        daemon = Daemon(scripts, config, engine, pool, profile)
+
+        # the first signal finishes the running cycle, a second one stops right away
+        def stop(signum, frame):
+            if daemon.stop.is_set():
+                raise KeyboardInterrupt
+            log.warning("Stopping after the running cycle")
+            daemon.stop.set()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        log_title(f"Watching {len(scripts)} scripts, auto-upgrade {daemon.policy}")
+        log_list([f"{x.stem}: every {state.interval:g}s" for x, state in daemon.scripts.items()])
+        address = config.get("daemon", {}).get("status", "")
+        if address:
+            with StatusServer(address, daemon) as server:
+                log.info(f"Status on http://{server.server_address[0]}:{server.server_address[1]}/status")
+                daemon.run()
+        else:
+            daemon.run()
+
+    except Exception as e:
+        log.error(e)
+        sys.exit(1)
@@ -0,0 +1,115 @@
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from rich.filesize import decimal
+
+from lib.helper import get_cache
+from lib.log import LogLevel, console, log, log_error, log_list, log_title
+from lib.store import ArtifactStore
+
+
+def retention(config: dict) -> tuple[int, int]:
+    # (keep_last, keep_days), keep_days 0 disables the age rule
+    table = config.get("retention", {})
+    return table.get("keep_last", 3), table.get("keep_days", 0)
+
+
+def expired(script: Path, config: dict) -> list[Path]:
+    # version dirs and stale partial downloads outside the retention policy
+    path_app = Path(config["path"]["data"]) / script.stem
+    if not path_app.exists():
+        return []
+    keep_last, keep_days = retention(config)
+    # the installed version and the one rollback returns to
+    current = [x.resolve() for x in (path_app / "latest", path_app / "previous") if x.exists()]
+    remote_version = get_cache(script, config)["remote_version"]
+    # the download and staging dirs of an install of the remote version that may be running
+    active = {f"temp_{remote_version}", f"temp_{remote_version}.stage", f"temp_{remote_version}.old"}
+
+    versions, paths = [], []
+    for path in path_app.iterdir():
+        if path.name.startswith("temp_"):
+            if path.name not in active:
+                paths.append(path)
+        elif path.is_dir() and not path.is_symlink():
+            versions.append(path)
+
+    # newest first
+    versions.sort(key=lambda x: x.stat().st_mtime, reverse=True)
+    cutoff = time.time() - keep_days * 86400
+    for i, path in enumerate(versions):
+        # resolved like current, the data dir may be a symlink or a relative path
+        if path.resolve() in current or i < keep_last or (keep_days > 0 and path.stat().st_mtime > cutoff):
+            continue
+        paths.append(path)
+    return paths
+
+
+def remove(path: Path) -> int:
+    # bytes freed, hardlinked files only count once their last link is gone
+    reclaimed = 0
+    files = [path] if path.is_file() else sorted(path.rglob("*"), reverse=True) + [path]
+    for file in files:
+        if file.is_dir() and not file.is_symlink():
+            file.rmdir()
+            continue
+        stat = file.lstat()
+        if stat.st_nlink == 1:
+            reclaimed += stat.st_size
+        file.unlink()
+    return reclaimed
+
+
+def sweep_store(config: dict, executor: ThreadPoolExecutor) -> tuple[int, int]:
+    # drop blobs no install links to anymore, and the url entries pointing at them
+    store = ArtifactStore(config)
+    if not store.root.exists():
+        return 0, 0
+    blobs = [x for x in (store.root / "sha256").glob("*/*") if x.stat().st_nlink == 1]
+    reclaimed = sum(executor.map(remove, blobs))
+    for shard in {x.parent for x in blobs}:
+        if not any(shard.iterdir()):
+            shard.rmdir()
+    for source in (store.root / "sources").glob("*.json"):
+        blob, _ = store.lookup_source(source)
+        if blob is None:
+            source.unlink()
+    return len(blobs), reclaimed
+
+
+def collect(scripts: list[Path], config: dict) -> tuple[list[Path], int, int]:
+    # (removed paths, unused artifacts, bytes reclaimed)
+    max_workers = config["worker"].get("gc", 8)
+    paths = [x for script in scripts for x in expired(script, config)]
+
+    # delete concurrently, the store goes last since it depends on the link counts
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        reclaimed = sum(executor.map(remove, paths))
+        blobs, reclaimed_store = sweep_store(config, executor)
+    return paths, blobs, reclaimed + reclaimed_store
+
+
+def log_collected(paths: list[Path], blobs: int, reclaimed: int, config: dict):
+    log_title(f"{len(paths)} removed, {blobs} unused artifacts, {decimal(reclaimed)} reclaimed")
+    log_list([str(x.relative_to(config["path"]["data"])) for x in paths])
+
+
+def auto_gc(scripts: list[Path], config: dict):
+    # [retention] auto, after upgrade and sync; the upgrade itself succeeded, so a failure only warns
+    if not config.get("retention", {}).get("auto", True) or len(scripts) == 0:
+        return
+    try:
+        log_collected(*collect(scripts, config), config)
+    except Exception as e:
+        log.warning(f"retention not applied: {e}")
+
+
+def do_gc(scripts: list[Path], config: dict, args: list[str]):
+    try:
+        log_collected(*collect(scripts, config), config)
+
+    except Exception as e:
+        log.error(e)
+        sys.exit(1)
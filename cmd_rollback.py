@@ -0,0 +1,49 @@
+import sys
+from pathlib import Path
+
+from lib.helper import get_cache, swap_link
+from lib.log import log, log_list, log_title
+
+
+def previous_version(script: Path, config: dict) -> tuple[Path, Path]:
+    # (latest, previous) version dirs of an installed script
+    path_app = Path(config["path"]["data"]) / script.stem
+    path_latest, path_previous = path_app / "latest", path_app / "previous"
+    if not path_latest.exists():
+        raise Exception(f"{script.stem} is not installed")
+    if not path_previous.exists():
+        raise Exception(f"{script.stem} has no previous version")
+    return path_latest.resolve(), path_previous.resolve()
+
+
+def rollback(script: Path, config: dict, current: Path, previous: Path):
+    # swap the two links, rolling back twice returns to where it started
+    path_app = Path(config["path"]["data"]) / script.stem
+    swap_link(path_app / "previous", current)
+    swap_link(path_app / "latest", previous)
+
+    cache = get_cache(script, config)
+    if cache["previous"] is not None:
+        cache["artifact"], cache["previous"] = cache["previous"], cache["artifact"]
+    # upgrade, sync and the daemon skip the version rolled back from, rolling forward again lifts it
+    cache["rolled_back"] = current.name if previous.name != cache["rolled_back"] else None
+    cache.save()
+
+
+def do_rollback(scripts: list[Path], config: dict, args: list[str]):
+    try:
+        if len(args) == 0:
+            raise Exception("rollback needs the scripts to roll back, e.g. rollback revanced-cli")
+
+        # check every script before touching any
+        versions = {x: previous_version(x, config) for x in scripts}
+        for script, (current, previous) in versions.items():
+            rollback(script, config, current, previous)
+
+        log_title(f"{len(versions)} rolled back")
+        log_list([f"{x.stem}: {current.name} -> {previous.name}" for x, (current, previous) in versions.items()])
+        log.info("The versions rolled back from are not upgraded to again, a newer release is")
+
+    except Exception as e:
+        log.error(e)
+        sys.exit(1)
@@ -0,0 +1,242 @@
+import sys
+import time
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, wait
+from functools import partial
+from pathlib import Path
+
+from rich import progress
+
+import cmd_install
+import cmd_update
+import cmd_upgrade
+from cmd_gc import auto_gc
+from lib.channel import ProgressChannel
+from lib.engine import AsyncEngine, call_script, run_async
+from lib.executor import WorkerPool, worker_pool
+from lib.graph import DependencyGraph, log_critical_path, log_order
+from lib.helper import Cache, is_current, load_caches, load_script
+from lib.log import LogLevel, console, log, log_error, log_list, log_title
+from lib.render import get_progress
+from lib.report import report, report_errors
+from lib.scheduler import REFRESH_PER_SECOND, TaskError, first_error, log_failures, refresh_progress, split_results
+
+
+def sync_limits(config: dict) -> tuple[int, int]:
+    # (concurrent release lookups, concurrent downloads)
+    return config["worker"].get("sync_api", 8), config["worker"].get("sync_download", 4)
+
+
+def do_task(_p_stats: ProgressChannel, task_id: int, script: Path, config: dict, cache: Cache):
+    # both stages in one worker, for scripts with custom hooks under the async engine
+    name, latest_version, remote_version = cmd_update.do_task(_p_stats, task_id, script, config, cache)
+    if is_current(cache, latest_version, remote_version):
+        return (name, latest_version, remote_version, False)
+    install = cmd_install.do_task if latest_version == "None" else cmd_upgrade.do_task
+    install(_p_stats, task_id, script, config, cache)
+    return (name, latest_version, remote_version, True)
+
+
+async def do_task_async(
+    engine: AsyncEngine,
+    _p_stats: ProgressChannel,
+    task_id: int,
+    script: Path,
+    config: dict,
+    cache: Cache,
+    graph: DependencyGraph,
+):
+    module = load_script(script)
+    # scripts with custom hooks run in the process pool
+    if not hasattr(module, "update_args") or not hasattr(module, "install_args"):
+        await graph.ready(script)
+        return await engine.run_sync(do_task, _p_stats, task_id, script, config, cache)
+
+    try:
+        # check, limited by the engine's api semaphore
+        await engine.single_update(_p_stats, task_id, script, config, cache, module.update_args(script, config))
+        name, latest_version, remote_version = cmd_update.task_result(script, config, cache)
+    except Exception as e:
+        raise TaskError("update", script, e)
+    if is_current(cache, latest_version, remote_version):
+        return (name, latest_version, remote_version, False)
+
+    # download, install and link, limited by the download semaphore, after the dependencies
+    await graph.ready(script)
+    try:
+        await engine.single_install_move(_p_stats, task_id, script, config, cache, module.install_args(script, config))
+        if hasattr(module, "post_install"):
+            await engine.run_sync(call_script, script, "post_install", script, config)
+        return (name, latest_version, remote_version, True)
+    except Exception as e:
+        raise TaskError("install" if latest_version == "None" else "upgrade", script, e)
+
+
+def batch_do_task(_prog: progress.Progress, _p_stats: ProgressChannel, submit: Callable, scripts: list[Path], config: dict):
+    p_task_summary = _prog.add_task("summary", total=len(scripts), progress_type="summary")
+
+    futures = []
+    caches = load_caches(scripts, config)
+    for i in range(0, len(scripts)):
+        task_id = _prog.add_task(
+            f"{scripts[i].stem}",
+            visible=False,
+            progress_type="download",
+        )
+        futures.append(submit(_p_stats, task_id, scripts[i], config, caches[scripts[i]]))
+
+    return p_task_summary, futures
+
+
+def pipeline(
+    _prog: progress.Progress,
+    pool: WorkerPool,
+    graph: DependencyGraph,
+    scripts: list[Path],
+    config: dict,
+    keep_going: bool = False,
+) -> tuple[list[tuple], list[Exception]]:
+    """Stream every script through check -> download/install as soon as its own check is done.
+
+    The stages have separate limits, so a slow download never holds back the checks. A script
+    is installed only after the scripts it depends on are up to date.
+    """
+    _p_stats = pool.channel
+    api_limit, download_limit = sync_limits(config)
+    p_task_summary = _prog.add_task("summary", total=len(scripts), progress_type="summary")
+
+    caches = load_caches(scripts, config)
+    task_ids = {x: _prog.add_task(x.stem, visible=False, progress_type="download") for x in scripts}
+    queue_update, queue_install = deque(scripts), deque()
+    running = {}
+    versions, results, errors = {}, [], []
+    settled, failed = set(), set()
+
+    while queue_update or queue_install or running:
+        # scripts whose dependencies failed are not installed
+        for script in [x for x in queue_install if any(d in failed for d in graph.depends[x])]:
+            queue_install.remove(script)
+            failed.add(script)
+            errors.append(TaskError("depends", script, f"{next(d for d in graph.depends[script] if d in failed).stem} failed"))
+
+        # admit work within each stage limit
+        stages = [x[0] for x in running.values()]
+        while queue_update and stages.count("update") < api_limit:
+            script = queue_update.popleft()
+            graph.start(script)
+            running[pool.submit(cmd_update.do_task, _p_stats, task_ids[script], script, config, caches[script])] = ("update", script)
+            stages.append("update")
+        while stages.count("install") < download_limit:
+            ready = [x for x in queue_install if all(d in settled for d in graph.depends[x])]
+            if len(ready) == 0:
+                break
+            script = ready[0]
+            queue_install.remove(script)
+            install = cmd_install.do_task if versions[script][0] == "None" else cmd_upgrade.do_task
+            running[pool.submit(install, _p_stats, task_ids[script], script, config, caches[script])] = ("install", script)
+            stages.append("install")
+
+        if len(running) == 0:
+            continue
+        done, _ = wait(running, timeout=1 / REFRESH_PER_SECOND, return_when=FIRST_COMPLETED)
+        for future in done:
+            stage, script = running.pop(future)
+            if future.exception() is not None:
+                errors.append(future.exception())
+                failed.add(script)
+                continue
+            result = future.result()
+            if stage == "update":
+                name, latest_version, remote_version = result
+                versions[script] = (latest_version, remote_version)
+                if is_current(caches[script], latest_version, remote_version):
+                    results.append((name, latest_version, remote_version, False))
+                    settled.add(script)
+                    graph.finish(script)
+                else:
+                    # the worker saved the new release, pick it up for the install stage
+                    caches[script].load()
+                    queue_install.append(script)
+            else:
+                latest_version, remote_version = versions[script]
+                results.append((script.stem, latest_version, remote_version, True))
+                settled.add(script)
+                graph.finish(script)
+        if len(errors) > 0 and not keep_going:
+            for future in running:
+                future.cancel()
+            raise first_error(errors)
+        refresh_progress(_prog, _p_stats, p_task_summary, len(results) + len(errors), len(scripts))
+
+    return results, errors
+
+
+def do_sync(
+    scripts: list[Path],
+    config: dict,
+    args: list[str],
+    engine: str = "process",
+    pool: WorkerPool | None = None,
+    keep_going: bool = False,
+) -> list[Exception]:
+    max_workers = sum(sync_limits(config))
+
+    try:
+        # dependencies first, their dependents install once they are done
+        graph = DependencyGraph(scripts)
+        scripts = graph.order()
+
+        # before progress bar
+        log_title(f"Syncing {len(scripts)} scripts")
+        log_order(graph)
+
+        with get_progress(
+            config,
+            len(scripts),
+            "[progress.description]{task.description}",
+            progress.BarColumn(bar_width=None),
+            "[progress.percentage]{task.percentage:>3.0f}%",
+            progress.TimeRemainingColumn(),
+            progress.TimeElapsedColumn(),
+            refresh_per_second=REFRESH_PER_SECOND,
+        ) as _prog:
+            with worker_pool(pool, config, max_workers, scripts) as pool:
+                pool.channel.reset()
+                if engine == "async":
+                    futures = run_async(
+                        _prog,
+                        pool,
+                        batch_do_task,
+                        partial(do_task_async, graph=graph),
+                        scripts,
+                        pool.config,
+                        sync_limits(config),
+                        wrap_submit=partial(graph.submit_async, gate=False),
+                        keep_going=keep_going,
+                    )
+                    results, errors = split_results(futures)
+                else:
+                    results, errors = pipeline(_prog, pool, graph, scripts, pool.config, keep_going)
+
+        # show upgraded scripts
+        upgraded = [x for x in results if x[3]]
+        log_title(f"{len(upgraded)} upgraded, {len(results) - len(upgraded)} up to date")
+        log_list([f"{x[0]}: {x[1]} -> {x[2]}" for x in upgraded])
+        for name, latest_version, remote_version, changed in results:
+            if not changed:
+                report("sync", name, "current", latest_version, remote_version)
+            else:
+                report("sync", name, "installed" if latest_version == "None" else "upgraded", remote_version, remote_version)
+        report_errors("sync", errors)
+        log_critical_path(graph)
+        log_failures(errors)
+
+        # apply the retention policy to what was upgraded, as upgrade does
+        changed = [x[0] for x in upgraded]
+        auto_gc([x for x in scripts if x.stem in changed], config)
+        return errors
+
+    except Exception as e:
+        log.error(e)
+        sys.exit(1)
@@ -1,16 +1,37 @@
-import multiprocessing
 import sys
 import time
-from concurrent.futures import ProcessPoolExecutor
+from collections.abc import Callable
+from functools import partial
 from pathlib import Path
 
 from rich import progress
 
-from lib.helper import Cache, SummaryProgress, load_script
+from lib.channel import ProgressChannel
+from lib.engine import AsyncEngine, run_async
+from lib.executor import WorkerPool, worker_pool
+from lib.graphql import batch_update, github_token
+from lib.helper import Cache, load_caches, load_script
 from lib.log import LogLevel, console, log, log_error, log_list, log_title
+from lib.render import get_progress
+from lib.report import report, report_errors
+from lib.scheduler import REFRESH_PER_SECOND, TaskError, log_failures, split_results, wait_futures
 
 
-def do_task(_p_stats: dict, task_id: int, script: Path, config: dict, cache: Cache):
+def task_result(script: Path, config: dict, cache: Cache):
+    # get installed version
+    path_latest = Path(config["path"]["data"]) / f"{script.stem}/latest"
+    if path_latest.exists():
+        latest_version = path_latest.resolve().name
+    else:
+        latest_version = "None"
+
+    # get remote version
+    remote_version = cache["remote_version"]
+
+    return (script.stem, latest_version, remote_version)
+
+
+def do_task(_p_stats: ProgressChannel, task_id: int, script: Path, config: dict, cache: Cache):
     try:
         module = load_script(script)
         module.update(
@@ -21,96 +42,102 @@ def do_task(_p_stats: dict, task_id: int, script: Path, config: dict, cache: Cac
             cache,
         )
 
-        # get installed version
-        path_latest = Path(config["path"]["data"]) / f"{script.stem}/latest"
-        if path_latest.exists():
-            latest_version = path_latest.resolve().name
-        else:
-            latest_version = "None"
+        return task_result(script, config, cache)
+
+    except Exception as e:
+        raise TaskError("update", script, e)
+
+
+async def do_task_async(engine: AsyncEngine, _p_stats: ProgressChannel, task_id: int, script: Path, config: dict, cache: Cache):
+    module = load_script(script)
+    # scripts with custom hooks run in the process pool
+    if not hasattr(module, "update_args"):
+        return await engine.run_sync(do_task, _p_stats, task_id, script, config, cache)
 
-        # get remote version
-        cache.load()
-        remote_version = cache["remote_version"]
+    try:
+        await engine.single_update(_p_stats, task_id, script, config, cache, module.update_args(script, config))
 
-        return (script.stem, latest_version, remote_version)
+        return task_result(script, config, cache)
 
     except Exception as e:
-        raise Exception(f"during update: {e=}\n{script=}")
+        raise TaskError("update", script, e)
 
 
-def batch_do_task(_prog: progress.Progress, _p_stats: dict, executor: ProcessPoolExecutor, scripts: list[Path], config: dict):
+def batch_do_task(_prog: progress.Progress, _p_stats: ProgressChannel, submit: Callable, scripts: list[Path], config: dict):
     p_task_summary = _prog.add_task("summary", total=len(scripts), progress_type="summary")
 
     futures = []
+    caches = load_caches(scripts, config)
     for i in range(0, len(scripts)):
-        cache = Cache(scripts[i].parent.parent / f"cache/{scripts[i].stem}.json")
+        cache = caches[scripts[i]]
         # task
         task_id = _prog.add_task(
             f"{scripts[i].stem}",
             visible=False,
             progress_type="download",
         )
-        futures.append(executor.submit(do_task, _p_stats, task_id, scripts[i], config, cache))
+        futures.append(submit(_p_stats, task_id, scripts[i], config, cache))
     _prog.update(p_task_summary, total=len(futures))
 
-    while True:
-        # check if any futures are done
-        finished_futures = [x for x in futures if x.done()]
-        try:
-            for future in finished_futures:
-                future.result()
-        except Exception as e:
-            for future in [x for x in futures if not x.done()]:
-                future.cancel()
-            raise e
-        # update progress
-        _prog.update(
-            p_task_summary,
-            completed=len(finished_futures),
-            total=len(futures),
-        )
-        for task_id, (completed, total) in _p_stats.items():
-            _prog.update(
-                task_id,
-                completed=completed,
-                total=total,
-                visible=completed < total,
-            )
-        # stop if all futures are done
-        if len(finished_futures) == len(futures):
-            break
-
-    return futures
+    return p_task_summary, futures
 
 
-def do_update(scripts: list[Path], config: dict, args: list[str]):
+def do_update(
+    scripts: list[Path],
+    config: dict,
+    args: list[str],
+    engine: str = "process",
+    pool: WorkerPool | None = None,
+    keep_going: bool = False,
+) -> list[Exception]:
     max_workers = config["worker"]["update"]
 
     try:
         # before progress bar
         log_title(f"Checking for updates for {len(scripts)} scripts")
 
-        with SummaryProgress(
+        # resolve GitHub releases in batched queries, the rest go through the pool
+        resolved = []
+        if config.get("github", {}).get("update_backend", "rest") == "graphql":
+            if github_token(config) is None:
+                log.warning("update_backend graphql requires a GitHub token, falling back to rest")
+            else:
+                pending, requests = batch_update(scripts, config)
+                resolved = [task_result(x, config, cache) for x, cache in load_caches(scripts, config).items() if x not in pending]
+                log.info(f"Resolved {len(resolved)} scripts in {requests} GraphQL requests")
+                scripts = pending
+
+        with get_progress(
+            config,
+            len(scripts),
             "[progress.description]{task.description}",
             progress.BarColumn(bar_width=None),
             "[progress.percentage]{task.percentage:>3.0f}%",
             progress.TimeRemainingColumn(),
             progress.TimeElapsedColumn(),
-            refresh_per_second=5,
+            refresh_per_second=REFRESH_PER_SECOND,
         ) as _prog:
-            with ProcessPoolExecutor(max_workers=max_workers) as executor:
-                with multiprocessing.Manager() as manager:
-                    _p_stats = manager.dict()
-                    futures = batch_do_task(_prog, _p_stats, executor, scripts, config)
+            with worker_pool(pool, config, max_workers, scripts) as pool:
+                _p_stats = pool.channel
+                _p_stats.reset()
+                if engine == "async":
+                    futures = run_async(_prog, pool, batch_do_task, do_task_async, scripts, pool.config, keep_going=keep_going)
+                else:
+                    p_task_summary, futures = batch_do_task(_prog, _p_stats, partial(pool.submit, do_task), scripts, pool.config)
+                    wait_futures(_prog, _p_stats, p_task_summary, futures, keep_going=keep_going)
 
         # show available updates
         results = []
-        for future in futures:
-            name, latest_version, remote_version = future.result()
+        checked, errors = split_results(futures)
+        for name, latest_version, remote_version in resolved + checked:
             if remote_version != latest_version:
                 results.append((name, latest_version, remote_version))
+            report("update", name, "available" if remote_version != latest_version else "current", latest_version, remote_version)
+        report_errors("update", errors)
         log_title(f"{len(results)} available updates")
         log_list([f"{x[0]}: {x[1]} -> {x[2]}" for x in results])
+        log_failures(errors)
+        return errors
 
     except Exception as e:
         log.error(e)
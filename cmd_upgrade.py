@@ -1,16 +1,32 @@
-import multiprocessing
 import sys
 import time
-from concurrent.futures import ProcessPoolExecutor
+from collections.abc import Callable
+from functools import partial
 from pathlib import Path
 
 from rich import progress
 
-from lib.helper import Cache, SummaryProgress, load_script
+from cmd_gc import auto_gc
+from lib.channel import ProgressChannel
+from lib.engine import AsyncEngine, call_script, run_async
+from lib.executor import WorkerPool, worker_pool
+from lib.graph import DependencyGraph, log_critical_path, log_order
+from lib.helper import Cache, is_current, load_caches, load_script
 from lib.log import LogLevel, console, log, log_error, log_list, log_title
+from lib.render import get_progress
+from lib.report import report, report_errors, report_skipped
+from lib.scheduler import REFRESH_PER_SECOND, TaskError, log_failures, split_results, wait_futures
 
 
-def do_task(_p_stats: dict, task_id: int, script: Path, config: dict, cache: Cache):
+def task_result(script: Path, config: dict, cache: Cache):
+    # get latest version
+    path_latest = Path(config["path"]["data"]) / f"{script.stem}/latest"
+    latest_version = path_latest.resolve().name
+
+    return (script.stem, latest_version)
+
+
+def do_task(_p_stats: ProgressChannel, task_id: int, script: Path, config: dict, cache: Cache):
     try:
         module = load_script(script)
         module.upgrade(
@@ -21,26 +37,40 @@ def do_task(_p_stats: dict, task_id: int, script: Path, config: dict, cache: Cac
             cache,
         )
 
-        # get latest version
-        path_latest = Path(config["path"]["data"]) / f"{script.stem}/latest"
-        latest_version = path_latest.resolve().name
+        return task_result(script, config, cache)
+
+    except Exception as e:
+        raise TaskError("upgrade", script, e)
+
 
-        return (script.stem, latest_version)
+async def do_task_async(engine: AsyncEngine, _p_stats: ProgressChannel, task_id: int, script: Path, config: dict, cache: Cache):
+    module = load_script(script)
+    # scripts with custom hooks run in the process pool
+    if not hasattr(module, "install_args"):
+        return await engine.run_sync(do_task, _p_stats, task_id, script, config, cache)
+
+    try:
+        await engine.single_install_move(_p_stats, task_id, script, config, cache, module.install_args(script, config))
+        if hasattr(module, "post_install"):
+            await engine.run_sync(call_script, script, "post_install", script, config)
+
+        return task_result(script, config, cache)
 
     except Exception as e:
-        raise Exception(f"during upgrade: {e=}\n{script=}")
+        raise TaskError("upgrade", script, e)
 
 
-def batch_do_task(_prog: progress.Progress, _p_stats: dict, executor: ProcessPoolExecutor, scripts: list[Path], config: dict):
+def batch_do_task(_prog: progress.Progress, _p_stats: ProgressChannel, submit: Callable, scripts: list[Path], config: dict):
     p_task_summary = _prog.add_task("summary", total=len(scripts), progress_type="summary")
 
     futures = []
+    caches = load_caches(scripts, config)
     for i in range(0, len(scripts)):
-        cache = Cache(scripts[i].parent.parent / f"cache/{scripts[i].stem}.json")
+        cache = caches[scripts[i]]
         # if already latest, skip
         path_latest = Path(config["path"]["data"]) / f"{scripts[i].stem}/latest"
         latest_version = path_latest.resolve().name
-        if cache["remote_version"] == latest_version:
+        if is_current(cache, latest_version, cache["remote_version"]):
             continue
         # task
         task_id = _prog.add_task(
@@ -48,63 +78,66 @@ def batch_do_task(_prog: progress.Progress, _p_stats: dict, executor: ProcessPoo
             visible=False,
             progress_type="download",
         )
-        futures.append(executor.submit(do_task, _p_stats, task_id, scripts[i], config, cache))
+        futures.append(submit(_p_stats, task_id, scripts[i], config, cache))
     _prog.update(p_task_summary, total=len(futures))
 
-    while True:
-        # check if any futures are done
-        finished_futures = [x for x in futures if x.done()]
-        try:
-            for future in finished_futures:
-                future.result()
-        except Exception as e:
-            for future in [x for x in futures if not x.done()]:
-                future.cancel()
-            raise e
-        # update progress
-        _prog.update(
-            p_task_summary,
-            completed=len(finished_futures),
-            total=len(futures),
-        )
-        for task_id, (completed, total) in _p_stats.items():
-            _prog.update(
-                task_id,
-                completed=completed,
-                total=total,
-                visible=completed < total,
-            )
-        # stop if all futures are done
-        if len(finished_futures) == len(futures):
-            break
+    return p_task_summary, futures
 
-    return futures
 
-
-def do_upgrade(scripts: list[Path], config: dict, args: list[str]):
+def do_upgrade(
+    scripts: list[Path],
+    config: dict,
+    args: list[str],
+    engine: str = "process",
+    pool: WorkerPool | None = None,
+    keep_going: bool = False,
+) -> list[Exception]:
     max_workers = config["worker"]["upgrade"]
 
     try:
+        # dependencies first, their dependents start once they are done
+        graph = DependencyGraph(scripts)
+        scripts = graph.order()
+
         # before progress bar
         log_title(f"Checking for updates for {len(scripts)} scripts")
+        log_order(graph)
 
-        with SummaryProgress(
+        with get_progress(
+            config,
+            len(scripts),
             "[progress.description]{task.description}",
             progress.BarColumn(bar_width=None),
             "[progress.percentage]{task.percentage:>3.0f}%",
             progress.TimeRemainingColumn(),
             progress.TimeElapsedColumn(),
-            refresh_per_second=5,
+            refresh_per_second=REFRESH_PER_SECOND,
         ) as _prog:
-            with ProcessPoolExecutor(max_workers=max_workers) as executor:
-                with multiprocessing.Manager() as manager:
-                    _p_stats = manager.dict()
-                    futures = batch_do_task(_prog, _p_stats, executor, scripts, config)
+            with worker_pool(pool, config, max_workers, scripts) as pool:
+                _p_stats = pool.channel
+                _p_stats.reset()
+                if engine == "async":
+                    futures = run_async(_prog, pool, batch_do_task, do_task_async, scripts, pool.config, wrap_submit=graph.submit_async, keep_going=keep_going)
+                else:
+                    p_task_summary, futures = batch_do_task(_prog, _p_stats, graph.submit(partial(pool.submit, do_task)), scripts, pool.config)
+                    wait_futures(_prog, _p_stats, p_task_summary, futures, keep_going=keep_going)
 
         # show upgraded scripts
-        results = [x.result() for x in futures]
-        log_title(f"{len(results)} upgraded, {len(scripts) - len(results)} skipped")
+        results, errors = split_results(futures)
+        log_title(f"{len(results)} upgraded, {len(scripts) - len(results) - len(errors)} skipped")
         log_list([f"{x[0]}: {x[1]}" for x in results])
+        for name, version in results:
+            report("upgrade", name, "upgraded", version, version)
+        report_skipped("upgrade", scripts, results, errors)
+        report_errors("upgrade", errors)
+        log_critical_path(graph)
+        log_failures(errors)
+
+        # apply the retention policy to what was upgraded
+        upgraded = [x[0] for x in results]
+        auto_gc([x for x in scripts if x.stem in upgraded], config)
+
+        return errors
 
     except Exception as e:
         log.error(e)
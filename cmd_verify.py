@@ -0,0 +1,67 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from lib.helper import load_caches
+from lib.log import log, log_list, log_title
+from lib.store import ArtifactStore, mmap_digest
+
+
+def check_file(path: Path, size: int | None, digest: str) -> str | None:
+    # what is wrong with the file, None if it is intact
+    if not path.exists():
+        return "missing"
+    if size is not None and path.stat().st_size != size:
+        return f"size {path.stat().st_size}, expected {size}"
+    if mmap_digest(path) != digest:
+        return "sha256 mismatch"
+    return None
+
+
+def installed(scripts: list[Path], config: dict) -> list[tuple[Path, int | None, str]]:
+    # the file each script last installed, with the size and digest recorded for it
+    path_data = Path(config["path"]["data"])
+    files = []
+    for script, cache in load_caches(scripts, config).items():
+        artifact = cache["artifact"]
+        if artifact is None:
+            continue
+        files.append((path_data / script.stem / artifact["file"], artifact["size"], artifact["sha256"]))
+    return files
+
+
+def stored(config: dict, exclude: set[tuple[int, int]]) -> list[tuple[Path, None, str]]:
+    # every blob of the store is named by its digest, minus those already checked through a hardlink
+    store = ArtifactStore(config)
+    if not store.root.exists():
+        return []
+    files = []
+    for blob in (store.root / "sha256").glob("*/*"):
+        stat = blob.stat()
+        if (stat.st_dev, stat.st_ino) not in exclude:
+            files.append((blob, None, blob.name))
+    return files
+
+
+def do_verify(scripts: list[Path], config: dict, args: list[str]):
+    max_workers = config["worker"].get("verify", 8)
+
+    try:
+        files = installed(scripts, config)
+        inodes = {(x.stat().st_dev, x.stat().st_ino) for x, _, _ in files if x.exists()}
+        files += stored(config, inodes)
+
+        # hashing releases the GIL, so threads read and hash files in parallel
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            problems = list(executor.map(lambda x: check_file(*x), files))
+
+        corrupt = [(path, problem) for (path, _, _), problem in zip(files, problems) if problem is not None]
+        log_title(f"{len(files) - len(corrupt)} verified, {len(corrupt)} corrupt")
+        log_list([f"{x.relative_to(config['path']['data'])}: {problem}" for x, problem in corrupt])
+
+    except Exception as e:
+        log.error(e)
+        sys.exit(1)
+
+    if len(corrupt) > 0:
+        sys.exit(1)
@@ -0,0 +1,60 @@
+import multiprocessing
+import time
+
+from lib.scheduler import REFRESH_PER_SECOND
+
+# shared slots of the current pool, set by the worker initializer
+_slots = None
+
+
+def attach_channel(slots):
+    global _slots
+    _slots = slots
+
+
+class ProgressChannel:
+    """Per-task (completed, total) progress in shared memory.
+
+    Drop-in for the `_p_stats` dict: workers assign `_p_stats[task_id] = (completed, total)`,
+    the parent reads `_p_stats.items()`. Intermediate updates are published at most once per
+    `interval` per task; a finished task (completed >= total) is always published.
+    """
+
+    def __init__(self, size: int, interval: float = 1 / REFRESH_PER_SECOND):
+        self.size = size
+        self.interval = interval
+        self.slots = multiprocessing.RawArray("q", size * 2)
+        self._published = {}
+
+    # only the layout is pickled, workers re-attach to the shared slots
+    def __getstate__(self):
+        return {"size": self.size, "interval": self.interval}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.slots = _slots
+        self._published = {}
+
+    def reset(self):
+        self.slots[:] = [0] * len(self.slots)
+        self._published = {}
+
+    # setter
+    def __setitem__(self, task_id: int, value: tuple[int, int]):
+        completed, total = value
+        now = time.monotonic()
+        if completed < total and now - self._published.get(task_id, -self.interval) < self.interval:
+            return
+        self._published[task_id] = now
+        self.slots[task_id * 2] = completed
+        self.slots[task_id * 2 + 1] = total
+
+    # getter
+    def __getitem__(self, task_id: int):
+        return (self.slots[task_id * 2], self.slots[task_id * 2 + 1])
+
+    def items(self):
+        for task_id in range(self.size):
+            total = self.slots[task_id * 2 + 1]
+            if total > 0:
+                yield task_id, (self.slots[task_id * 2], total)
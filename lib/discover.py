@@ -0,0 +1,13 @@
+import os
+from pathlib import Path
+
+SCRIPT_SUFFIXES = (".py", ".toml")
+
+
+def find_scripts(path: Path) -> list[Path]:
+    # walk the scripts dir without descending into __pycache__ or hidden dirs
+    scripts = []
+    for root, dirs, files in os.walk(path):
+        dirs[:] = [x for x in dirs if not x.startswith((".", "__"))]
+        scripts += [Path(root) / x for x in files if os.path.splitext(x)[1] in SCRIPT_SUFFIXES]
+    return scripts
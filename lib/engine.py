@@ -0,0 +1,192 @@
+import asyncio
+from pathlib import Path
+
+import httpx
+from rich import progress
+
+from lib.executor import WorkerPool
+from lib.helper import (
+    HEADERS,
+    DownloadFile,
+    SegmentedFile,
+    check_segment,
+    conditional_headers,
+    finish_install,
+    finish_update,
+    load_script,
+    prepare_install,
+    segment_plan,
+    still_current,
+    store_download,
+    stored_artifact,
+)
+from lib.retry import RetryPolicy, http_timeout
+from lib.scheduler import REFRESH_PER_SECOND, first_error, refresh_progress
+from lib.spans import run_profiled_async, span
+from lib.store import ArtifactStore
+from lib.transport import make_async_client
+
+
+def call_script(script: Path, name: str, *args):
+    # entry point for script hooks sent to the process pool
+    module = load_script(script)
+    return getattr(module, name)(*args)
+
+
+class AsyncEngine:
+    """Runs release lookups and downloads as coroutines on one `httpx.AsyncClient`.
+
+    Scripts that provide `update_args`/`install_args` are handled in the event loop, anything
+    else (custom hooks, `post_install`) is sent to the worker pool, which starts on first use.
+    """
+
+    def __init__(self, config: dict, pool: WorkerPool, api_limit: int | None = None, download_limit: int | None = None):
+        self.config = config
+        self.pool = pool
+        self._p_stats = pool.channel
+        # concurrent release lookups and downloads
+        self.api_limit = asyncio.Semaphore(api_limit or config["worker"].get("async", 16))
+        self.download_limit = asyncio.Semaphore(download_limit or config["worker"].get("async", 16))
+        self.retry = RetryPolicy(config)
+        self.limiter = pool.limiter
+        # downloads of this process run up to the semaphore, not the pool size
+        self.limiter.callers = download_limit or config["worker"].get("async", 16)
+        self.client = make_async_client(config, HEADERS, http_timeout(config), pool.stats)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+
+    async def run_sync(self, fn, *args):
+        return await asyncio.wrap_future(self.pool.submit(fn, *args))
+
+    async def get_release(self, url: str, headers: dict) -> httpx.Response:
+        async with self.limiter.request_async(url):
+            response = await self.client.get(url, headers=headers, follow_redirects=True)
+        self.limiter.observe(url, response)
+        if response.status_code != httpx.codes.NOT_MODIFIED:
+            response.raise_for_status()
+        return response
+
+    async def single_update(self, _p_stats: dict, task_id: int, script: Path, config: dict, cache: dict, args: dict):
+        # args
+        url: str = args["url"]
+
+        async with self.api_limit:
+            # fetch remote
+            _p_stats[task_id] = (0, 2)
+            with span("release", url=url):
+                response = await self.retry.call_async(self.get_release, url, conditional_headers(cache, url))
+        finish_update(_p_stats, task_id, script, cache, args, response)
+
+    async def download(self, _p_stats: dict, task_id: int, url: str, path_tempFile: Path, cache: dict) -> tuple[int, str, str | None]:
+        # (size, sha256, etag) of the downloaded asset
+        sink = DownloadFile(_p_stats, task_id, url, path_tempFile, cache)
+        while True:
+            async with self.limiter.request_async(url) as lease, self.client.stream("GET", url, headers=sink.headers, follow_redirects=True) as response:
+                response.raise_for_status()
+                started = sink.start(response)
+                if started:
+                    with sink:
+                        async for chunk in response.aiter_bytes():
+                            sink.write(chunk, response.num_bytes_downloaded)
+                lease.bytes = response.num_bytes_downloaded
+            if started:
+                return sink.finish(response)
+
+    async def download_segmented(self, _p_stats: dict, task_id: int, url: str, path_tempFile: Path, segments: int, min_size: int) -> tuple[int, str, str | None] | None:
+        # probe, None if the asset cannot be split
+        async with self.limiter.request_async(url):
+            response = await self.client.head(url, follow_redirects=True)
+        sink = SegmentedFile(_p_stats, task_id, path_tempFile, response, segments, min_size)
+        if not sink.splittable:
+            return None
+
+        async def fetch(start: int, end: int):
+            with sink.open(start) as f:
+                async with self.limiter.request_async(sink.url) as lease, self.client.stream("GET", sink.url, headers=sink.headers(start, end)) as response:
+                    check_segment(response, start, end, sink.total, sink.etag)
+                    async for chunk in response.aiter_bytes():
+                        sink.write(f, chunk)
+                    lease.bytes = response.num_bytes_downloaded
+                    sink.check(response, start, end)
+
+        sink.preallocate()
+        await asyncio.gather(*[fetch(start, end) for start, end in sink.ranges])
+        return sink.finish()
+
+    async def find_artifact(self, store: ArtifactStore, cache: dict) -> Path | None:
+        blob, etag = stored_artifact(store, cache)
+        if blob is None or etag is None:
+            return blob
+        async with self.limiter.request_async(cache["download_url"]):
+            response = await self.client.head(cache["download_url"], follow_redirects=True)
+        return blob if still_current(response, etag) else None
+
+    async def fetch_artifact(self, _p_stats: dict, task_id: int, store: ArtifactStore, path_app: Path, config: dict, cache: dict, args: dict) -> Path:
+        blob = await self.find_artifact(store, cache)
+        if blob is not None:
+            return blob
+        path_tempFile = path_app / f"temp_{cache['remote_version']}"
+        segments, min_size = segment_plan(config, args)
+        result = None
+        with span("download") as attrs:
+            if segments > 1:
+                result = await self.download_segmented(_p_stats, task_id, cache["download_url"], path_tempFile, segments, min_size)
+            if result is None:
+                result = await self.download(_p_stats, task_id, cache["download_url"], path_tempFile, cache)
+            attrs["bytes"] = result[0]
+        return store_download(store, path_tempFile, cache, result)
+
+    async def single_install_move(self, _p_stats: dict, task_id: int, script: Path, config: dict, cache: dict, args: dict):
+        path_app, path_remote, store = prepare_install(_p_stats, task_id, script, config, cache)
+        async with self.download_limit:
+            blob = await self.retry.call_async(self.fetch_artifact, _p_stats, task_id, store, path_app, config, cache, args)
+        finish_install(_p_stats, task_id, blob, store, path_app, path_remote, cache, args["save_name"])
+
+    async def wait(self, _prog: progress.Progress, p_task_summary: int, tasks: list[asyncio.Task], keep_going: bool = False):
+        # same contract as scheduler.wait_futures, on asyncio tasks
+        interval = 1 / REFRESH_PER_SECOND
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=interval)
+            # retrieving every error of this tick also keeps asyncio from logging them
+            errors = [x.exception() for x in done if not x.cancelled() and x.exception() is not None]
+            if len(errors) > 0 and not keep_going:
+                for task in pending:
+                    task.cancel()
+                raise first_error(errors)
+            refresh_progress(_prog, self._p_stats, p_task_summary, len(tasks) - len(pending), len(tasks))
+
+        return tasks
+
+
+def run_async(
+    _prog: progress.Progress,
+    pool: WorkerPool,
+    batch_do_task,
+    do_task_async,
+    scripts: list[Path],
+    config: dict,
+    limits: tuple = (None, None),
+    wrap_submit=None,
+    keep_going: bool = False,
+):
+    async def main():
+        async with AsyncEngine(config, pool, *limits) as engine:
+
+            def submit(*args):
+                if pool.profile is not None:
+                    return asyncio.ensure_future(run_profiled_async(pool.profile, do_task_async, engine, *args))
+                return asyncio.ensure_future(do_task_async(engine, *args))
+
+            # e.g. DependencyGraph.submit_async, to hold tasks back until their dependencies are done
+            if wrap_submit is not None:
+                submit = wrap_submit(submit)
+
+            p_task_summary, tasks = batch_do_task(_prog, pool.channel, submit, scripts, config)
+            return await engine.wait(_prog, p_task_summary, tasks, keep_going)
+
+    return asyncio.run(main())
@@ -0,0 +1,96 @@
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import nullcontext
+from pathlib import Path
+
+from lib.channel import ProgressChannel, attach_channel
+from lib.helper import configure_client, load_script
+from lib.limiter import HostLimiter, attach_limiter
+from lib.spans import Profile, attach_profile, current_profile, submit_profiled
+from lib.transport import TransportStats
+
+# config of the current pool, set by the worker initializer
+_config = None
+
+
+def worker_config() -> dict:
+    return _config
+
+
+class WorkerConfig(dict):
+    """The config as a plain dict, sent to every worker once by the initializer.
+
+    Tasks only pickle a reference to it, which resolves to the worker's copy.
+    """
+
+    def __reduce__(self):
+        return (worker_config, ())
+
+
+def init_worker(slots, limiter: HostLimiter, stats: TransportStats, profile: Profile | None, config: dict, scripts: list[Path]):
+    global _config
+    attach_channel(slots)
+    attach_limiter(limiter)
+    attach_profile(profile)
+    _config = config
+    # one pooled client per worker, kept for every task of the run
+    configure_client(config, stats)
+    # import every script once, later tasks hit the load_script cache
+    for script in scripts:
+        load_script(script)
+
+
+class WorkerPool:
+    """A process pool started once and shared by every command of an invocation.
+
+    Workers are started on the first submit, so an async run that never falls back to
+    the pool never starts one.
+    """
+
+    def __init__(self, config: dict, max_workers: int, scripts: list[Path]):
+        self.config = WorkerConfig(config.unwrap() if hasattr(config, "unwrap") else config)
+        self.max_workers = max_workers
+        self.scripts = scripts
+        # slot 0 is the summary task, one slot per script after it
+        self.channel = ProgressChannel(len(scripts) + 1)
+        # host budgets shared by the parent (async engine) and the workers
+        self.limiter = HostLimiter(self.config, max_workers)
+        attach_limiter(self.limiter)
+        # connection reuse of the parent, the workers and the async engine
+        self.stats = TransportStats()
+        configure_client(self.config, self.stats)
+        # --profile: tasks send their spans back with the result
+        self.profile = current_profile()
+        self._executor = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=init_worker,
+                initargs=(self.channel.slots, self.limiter, self.stats, self.profile, dict(self.config), self.scripts),
+            )
+        return self._executor
+
+    def submit(self, fn, *args) -> Future:
+        if self.profile is not None:
+            return submit_profiled(self.profile, self.executor.submit, fn, *args)
+        return self.executor.submit(fn, *args)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+
+def worker_pool(pool: WorkerPool | None, config: dict, max_workers: int, scripts: list[Path]):
+    # reuse the invocation's pool, or run a pool for this command only
+    if pool is not None:
+        return nullcontext(pool)
+    return WorkerPool(config, max_workers, scripts)
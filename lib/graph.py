@@ -0,0 +1,152 @@
+import asyncio
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import CancelledError, Future
+from functools import partial
+from pathlib import Path
+
+from lib.helper import load_script
+from lib.log import log_list, log_title
+from lib.scheduler import TaskError
+
+
+def script_depends(script: Path) -> list[str]:
+    # names of the scripts this script needs, `depends` in a script or manifest
+    return list(getattr(load_script(script), "depends", []))
+
+
+class DependencyGraph:
+    """The scripts of one batch and the scripts they depend on.
+
+    Dependencies outside the batch (not enabled, filtered out) are ignored. Wrap a command's
+    submit with `submit`/`submit_async` so a script starts only after its dependencies are
+    finished; independent scripts still run in parallel.
+    """
+
+    def __init__(self, scripts: list[Path]):
+        stems = {x.stem: x for x in scripts}
+        self.scripts = scripts
+        self.depends = {x: [stems[d] for d in script_depends(x) if d in stems] for x in scripts}
+        self.futures = {}
+        self.started = {}
+        self.finished = {}
+        self._lock = threading.Lock()
+
+    @property
+    def has_depends(self) -> bool:
+        return any(self.depends.values())
+
+    def levels(self) -> list[list[Path]]:
+        # scripts grouped by depth, every level only depends on the levels before it
+        levels, placed = [], set()
+        while len(placed) < len(self.scripts):
+            level = [x for x in self.scripts if x not in placed and all(d in placed for d in self.depends[x])]
+            if len(level) == 0:
+                cycle = [x.stem for x in self.scripts if x not in placed]
+                raise Exception(f"dependency cycle between {cycle}")
+            levels.append(level)
+            placed.update(level)
+        return levels
+
+    def order(self) -> list[Path]:
+        return [x for level in self.levels() for x in level]
+
+    def start(self, script: Path):
+        self.started[script] = time.monotonic()
+
+    def finish(self, script: Path):
+        self.finished[script] = time.monotonic()
+
+    def submit(self, submit: Callable) -> Callable:
+        # process pool: return a placeholder future at once, submit once the dependencies are done
+        def wrapped(*args) -> Future:
+            script = args[2]
+            future = Future()
+            depends = {x: self.futures[x] for x in self.depends[script] if x in self.futures}
+            self.futures[script] = future
+
+            def start(_=None):
+                # runs once per finished dependency, possibly from several threads
+                with self._lock:
+                    if script in self.started or future.done() or not all(x.done() for x in depends.values()):
+                        return
+                    self.start(script)
+                # resolving the future runs the callbacks of its dependents, outside the lock
+                failed = [x for x, y in depends.items() if y.cancelled() or y.exception() is not None]
+                if len(failed) > 0:
+                    future.set_exception(TaskError("depends", script, f"{failed[0].stem} failed"))
+                elif future.set_running_or_notify_cancel():
+                    submit(*args).add_done_callback(partial(self._done, script, future))
+
+            for x in depends.values():
+                x.add_done_callback(start)
+            start()
+            return future
+
+        return wrapped
+
+    def _done(self, script: Path, future: Future, inner: Future):
+        if inner.cancelled():
+            future.set_exception(CancelledError())
+        elif inner.exception() is not None:
+            future.set_exception(inner.exception())
+        else:
+            self.finish(script)
+            future.set_result(inner.result())
+
+    def submit_async(self, submit: Callable, gate: bool = True) -> Callable:
+        # event loop: the task awaits its dependencies first, unless the task waits itself (`ready`)
+        def wrapped(*args) -> asyncio.Future:
+            script = args[2]
+
+            async def run():
+                if gate:
+                    await self.ready(script)
+                self.start(script)
+                result = await submit(*args)
+                self.finish(script)
+                return result
+
+            self.futures[script] = asyncio.ensure_future(run())
+            return self.futures[script]
+
+        return wrapped
+
+    async def ready(self, script: Path):
+        for x in self.depends[script]:
+            if x not in self.futures:
+                continue
+            try:
+                await self.futures[x]
+            except Exception:
+                raise TaskError("depends", script, f"{x.stem} failed")
+
+    def critical_path(self) -> tuple[list[Path], float]:
+        # the chain of dependencies that finished last, walking back from the last script
+        if len(self.finished) == 0:
+            return [], 0.0
+        path = [max(self.finished, key=self.finished.get)]
+        while True:
+            depends = [x for x in self.depends[path[0]] if x in self.finished]
+            if len(depends) == 0:
+                break
+            path.insert(0, max(depends, key=self.finished.get))
+        return path, self.finished[path[-1]] - self.started[path[0]]
+
+
+def log_order(graph: DependencyGraph):
+    if not graph.has_depends:
+        return
+    log_title("Order")
+    log_list([", ".join(x.stem for x in level) for level in graph.levels()])
+
+
+def log_critical_path(graph: DependencyGraph):
+    if not graph.has_depends:
+        return
+    path, total = graph.critical_path()
+    if len(path) == 0:
+        return
+    log_title(f"Critical path {total:.2f}s")
+    log_list([f"{x.stem}: {graph.finished[x] - graph.started[x]:.2f}s" for x in path])
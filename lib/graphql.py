@@ -0,0 +1,103 @@
+import os
+import re
+from pathlib import Path
+
+import httpx
+import orjson
+
+from lib import helper
+from lib.helper import apply_release, load_caches, load_script, save_caches
+from lib.limiter import host_limiter
+from lib.retry import RetryPolicy
+
+GRAPHQL_URL = "https://api.github.com/graphql"
+# repositories per query, well below the node limit with 100 assets each
+CHUNK_SIZE = 50
+
+regex_release_url = re.compile(r"^https://api\.github\.com/repos/(?P<owner>[^/]+)/(?P<name>[^/]+)/releases/latest$")
+
+
+def github_token(config: dict) -> str | None:
+    return config.get("github", {}).get("token") or os.environ.get("GITHUB_TOKEN")
+
+
+def build_query(repos: list[tuple[str, str]]) -> str:
+    fields = []
+    for i, (owner, name) in enumerate(repos):
+        fields.append(
+            f"r{i}: repository(owner: {orjson.dumps(owner).decode()}, name: {orjson.dumps(name).decode()}) "
+            "{ latestRelease { tagName releaseAssets(first: 100) { nodes { name downloadUrl } } } }"
+        )
+    return "query {\n" + "\n".join(fields) + "\n}"
+
+
+def post_query(chunk: list[tuple[str, str]], token: str) -> dict:
+    limiter = host_limiter()
+    with limiter.request(GRAPHQL_URL):
+        response = helper.client.post(
+            GRAPHQL_URL,
+            headers={"Authorization": f"bearer {token}"},
+            content=orjson.dumps({"query": build_query(chunk)}),
+        )
+    limiter.observe(GRAPHQL_URL, response)
+    response.raise_for_status()
+    data = response.json()
+    if data.get("errors") and not data.get("data"):
+        raise httpx.HTTPError(f"graphql: {data['errors'][0]['message']}")
+    return data
+
+
+def query_releases(repos: list[tuple[str, str]], token: str, retry: RetryPolicy) -> list[dict | None]:
+    # latest release of each repo in the REST shape, None if it has none
+    releases = []
+    for i in range(0, len(repos), CHUNK_SIZE):
+        chunk = repos[i : i + CHUNK_SIZE]
+        data = retry.call(post_query, chunk, token)
+        for j in range(len(chunk)):
+            repository = (data["data"] or {}).get(f"r{j}")
+            if repository is None or repository["latestRelease"] is None:
+                releases.append(None)
+                continue
+            release = repository["latestRelease"]
+            releases.append(
+                {
+                    "tag_name": release["tagName"],
+                    "assets": [{"name": x["name"], "browser_download_url": x["downloadUrl"]} for x in release["releaseAssets"]["nodes"]],
+                }
+            )
+    return releases
+
+
+def batch_update(scripts: list[Path], config: dict) -> tuple[list[Path], int]:
+    """Resolve the latest release of every GitHub-backed script in batched GraphQL queries.
+
+    Fills `remote_version`/`download_url` of the resolved caches and returns the scripts
+    left for the per-script update, with the number of requests sent.
+    """
+    token = github_token(config)
+    if token is None:
+        return scripts, 0
+
+    resolved, repos, remaining = [], [], []
+    for script in scripts:
+        module = load_script(script)
+        args = module.update_args(script, config) if hasattr(module, "update_args") else None
+        match = regex_release_url.match(args["url"]) if args is not None else None
+        if match is None:
+            remaining.append(script)
+            continue
+        resolved.append((script, args))
+        repos.append((match.group("owner"), match.group("name")))
+
+    releases = query_releases(repos, token, RetryPolicy(config))
+    caches = load_caches([x[0] for x in resolved], config)
+    updated = []
+    for (script, args), release in zip(resolved, releases):
+        if release is None:
+            remaining.append(script)
+            continue
+        apply_release(script, caches[script], release, args)
+        updated.append(caches[script])
+    save_caches(updated, config)
+
+    return remaining, -(-len(repos) // CHUNK_SIZE)
@@ -1,41 +1,58 @@
+import hashlib
 import importlib.util
 import os
 import platform
 import re
 import shutil
-import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import httpx
-import orjson
-from rich import progress
 
-from lib.log import console, log
+from lib.limiter import host_limiter
+from lib.retry import RetryPolicy, http_timeout
+from lib.spans import span
+from lib.state import open_backend
+from lib.store import ArtifactStore, IntegrityError, file_digest
+from lib.transport import TransportStats, make_client
 
-client = httpx.Client(
-    headers={
-        "User-Agent": f"Mapo/0.1 (Python {platform.python_version()}, httpx/{httpx.__version__}; {platform.system()} {platform.release()}) +github.com/Elypha/Mapo",
-    }
-)
+HEADERS = {
+    "User-Agent": f"Mapo/0.1 (Python {platform.python_version()}, httpx/{httpx.__version__}; {platform.system()} {platform.release()}) +github.com/Elypha/Mapo",
+}
+
+client = httpx.Client(headers=HEADERS)
+
+GITHUB_API = "https://api.github.com"
+
+
+def configure_client(config: dict, stats: TransportStats | None = None):
+    # replace the shared client of this process by a pooled one with the [http] settings
+    global client
+    client.close()
+    client = make_client(config, HEADERS, http_timeout(config), stats)
+    # scripts import the client by name, loaded ones would keep the closed one
+    _modules.clear()
 
 
 class Cache(dict):
-    def __init__(self, cache_file: Path):
-        self.file = cache_file
-        if not self.file.parent.exists():
-            self.file.parent.mkdir(parents=True, exist_ok=True)
-        if not self.file.exists():
-            self.data = {}
-            self.save()
-        self.load()
+    def __init__(self, name: str, backend, data: dict | None = None):
+        self.name = name
+        self.backend = backend
+        if data is None:
+            self.load()
+        else:
+            self.data = data
+
+    # sent with every task, the backend travels as a reference to the worker's own
+    def __reduce__(self):
+        return (Cache, (self.name, self.backend, self.data))
 
     def load(self):
-        with open(self.file, "rb") as f:
-            self.data = orjson.loads(f.read())
+        self.data = self.backend.load(self.name)
 
     def save(self):
-        with open(self.file, "wb") as f:
-            f.write(orjson.dumps(self.data, option=orjson.OPT_INDENT_2))
+        self.backend.save(self.name, self.data)
 
     # setter
     def __setitem__(self, key, value):
@@ -61,126 +78,495 @@ class Cache(dict):
         return len(self.data)
 
 
-class SummaryProgress(progress.Progress):
-    def get_renderables(self):
-        for task in self.tasks:
-            if task.fields.get("progress_type") == "summary":
-                self.columns = (
-                    progress.TextColumn(
-                        "[aquamarine3]Downloading file" + ("s" if task.total > 1 else ""),
-                        justify="right",
-                    ),
-                    progress.BarColumn(bar_width=None),
-                    "[progress.percentage][steel_blue1]{task.percentage:>3.1f}%",
-                    "•",
-                    progress.TextColumn(
-                        "[aquamarine3]{task.completed} of {task.total} completed",
-                        justify="right",
-                    ),
-                )
-            if task.fields.get("progress_type") == "download":
-                self.columns = (
-                    progress.TextColumn("[blue]{task.description}", justify="right"),
-                    progress.BarColumn(bar_width=None),
-                    "[progress.percentage][steel_blue3]{task.percentage:>3.1f}%",
-                    "•",
-                    progress.DownloadColumn(),
-                    "•",
-                    progress.TransferSpeedColumn(),
-                    "•",
-                    progress.TimeRemainingColumn(),
-                )
-            yield self.make_tasks_table([task])
+def get_cache(script: Path, config: dict) -> Cache:
+    return Cache(script.stem, open_backend(config))
+
+
+def load_caches(scripts: list[Path], config: dict) -> dict[Path, Cache]:
+    # one read for all scripts
+    backend = open_backend(config)
+    items = backend.load_many([x.stem for x in scripts])
+    return {x: Cache(x.stem, backend, items[x.stem]) for x in scripts}
+
+
+def save_caches(caches: list[Cache], config: dict):
+    # one transaction for all scripts
+    open_backend(config).save_many({x.name: x.data for x in caches})
+
+
+# loaded scripts of this process by path, reloaded when the file changes
+_modules = {}
 
 
 def load_script(script: Path):
-    name = f"{script.stem}"
-    spec = importlib.util.spec_from_file_location(name, str(script))
-    module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(module)
+    mtime = script.stat().st_mtime_ns
+    if script in _modules and _modules[script][0] == mtime:
+        return _modules[script][1]
+
+    with span("load_script", script=script.stem):
+        # declarative manifest
+        if script.suffix == ".toml":
+            from lib.manifest import load_manifest
+
+            module = load_manifest(script)
+        else:
+            name = f"{script.stem}"
+            spec = importlib.util.spec_from_file_location(name, str(script))
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+
+    _modules[script] = (mtime, module)
     return module
 
 
+def swap_link(path: Path, target: Path):
+    # a new link renamed over the old one, so the path never goes missing
+    path_temp = path.with_name(f".{path.name}.tmp")
+    path_temp.unlink(missing_ok=True)
+    path_temp.symlink_to(target, target_is_directory=True)
+    os.replace(path_temp, path)
+
+
 def update_link(target: Path, name: str = "latest"):
     path_latest = target.parent / name
-    if path_latest.exists():
-        path_latest.unlink()
-    path_latest.symlink_to(target, target_is_directory=True)
+    with span("link"):
+        # the version it pointed to stays reachable for rollback
+        if name == "latest" and path_latest.is_symlink() and path_latest.exists() and path_latest.resolve() != target.resolve():
+            swap_link(target.parent / "previous", path_latest.resolve())
+        swap_link(path_latest, target)
 
 
-def single_update(_p_stats: dict, task_id: int, script: Path, config: dict, cache: dict, args: dict):
+def github_api(config: dict) -> str:
+    # REST base url, [github] api_url points it at GitHub Enterprise or a local stub
+    return config.get("github", {}).get("api_url", GITHUB_API).rstrip("/")
+
+
+def apply_release(script: Path, cache: dict, data: dict | list, args: dict):
     # args
     url: str = args["url"]
     regex_asset: re.Pattern = args["regex_asset"]
     regex_version: re.Pattern = args["regex_version"]
 
-    # fetch remote
-    _p_stats[task_id] = (0, 2)
-    response = client.get(url, follow_redirects=True)
-    response.raise_for_status()
-
-    # process data
-    _p_stats[task_id] = (1, 2)
-    data = response.json()
-
-    # [+] github
-    if "api.github.com" in url:
+    # [+] github, by host unless the args say so
+    if args.get("github", "api.github.com" in url):
         if isinstance(data, list):
             data = data[0]
         # remote version
-        remote_version = regex_version.search(data["tag_name"]).group("version")
-        if remote_version is None:
-            log.error(f"no matching remote_version for {script.stem}")
-            sys.exit(1)
+        match = regex_version.search(data["tag_name"])
+        if match is None or match.group("version") is None:
+            raise Exception(f"no matching remote_version for {script.stem} in {data['tag_name']}")
+        remote_version = match.group("version")
         cache["remote_version"] = remote_version
         # download_url
-        download_url = None
+        download_url, digest = None, None
         for asset in data["assets"]:
             if regex_asset.match(asset["name"]):
                 download_url = asset["browser_download_url"]
+                digest = asset.get("digest") or ""
                 break
         if download_url is None:
-            log.error(f"no matching download_url for {script.stem}@{remote_version}")
-            sys.exit(1)
+            raise Exception(f"no matching download_url for {script.stem}@{remote_version}")
         cache["download_url"] = download_url
+        # published sha256 of the asset, if any
+        cache["digest"] = digest.removeprefix("sha256:") if digest.startswith("sha256:") else None
+
+
+def conditional_headers(cache: dict, url: str) -> dict:
+    # revalidate only a complete lookup of the same url
+    if cache["url"] != url or cache["remote_version"] is None or cache["download_url"] is None:
+        return {}
+    headers = {}
+    if cache["etag"] is not None:
+        headers["If-None-Match"] = cache["etag"]
+    if cache["last_modified"] is not None:
+        headers["If-Modified-Since"] = cache["last_modified"]
+    return headers
+
+
+def save_validators(cache: dict, url: str, response: httpx.Response):
+    cache["url"] = url
+    cache["etag"] = response.headers.get("ETag")
+    cache["last_modified"] = response.headers.get("Last-Modified")
+
+
+def get_release(url: str, headers: dict) -> httpx.Response:
+    limiter = host_limiter()
+    with limiter.request(url):
+        response = client.get(url, headers=headers, follow_redirects=True)
+    limiter.observe(url, response)
+    if response.status_code != httpx.codes.NOT_MODIFIED:
+        response.raise_for_status()
+    return response
+
+
+def finish_update(_p_stats: dict, task_id: int, script: Path, cache: dict, args: dict, response: httpx.Response):
+    # what both engines do with the release lookup
+    if response.status_code == httpx.codes.NOT_MODIFIED:
+        # unchanged since the last lookup
+        _p_stats[task_id] = (2, 2)
+        return
+
+    # process data
+    _p_stats[task_id] = (1, 2)
+    apply_release(script, cache, response.json(), args)
+    save_validators(cache, args["url"], response)
 
     # finish
     cache.save()
     _p_stats[task_id] = (2, 2)
 
 
-def single_install_move(_p_stats: dict, task_id: int, script: Path, config: dict, cache: dict, args: dict):
+def single_update(_p_stats: dict, task_id: int, script: Path, config: dict, cache: dict, args: dict):
     # args
-    save_name: str = args["save_name"]
+    url: str = args["url"]
 
-    # prepare remote dir
-    _p_stats[task_id] = (0, 1)
-    path_app = Path(config["path"]["data"]) / script.stem
-    path_remote = path_app / cache["remote_version"]
-    path_remote.mkdir(parents=True)
+    # fetch remote
+    _p_stats[task_id] = (0, 2)
+    with span("release", url=url):
+        response = RetryPolicy(config).call(get_release, url, conditional_headers(cache, url))
+    finish_update(_p_stats, task_id, script, cache, args, response)
+
+
+def resume_headers(cache: dict, url: str, path_tempFile: Path) -> tuple[int, dict]:
+    # resume a partial download of the same asset, validated by If-Range
+    partial = cache["partial"]
+    if partial is None or partial["url"] != url or not path_tempFile.exists():
+        return 0, {}
+    validator = partial["etag"] or partial["last_modified"]
+    offset = path_tempFile.stat().st_size
+    if validator is None or partial["length"] is None or not 0 < offset < partial["length"]:
+        return 0, {}
+    return offset, {"Range": f"bytes={offset}-", "If-Range": validator}
+
+
+regex_content_range = re.compile(r"^bytes (?P<start>\d+)-\d+/(?P<length>\d+|\*)$")
+
+
+def resume_offset(response: httpx.Response, offset: int, cache: dict) -> int | None:
+    # bytes already on disk, 0 to start over, None if the range cannot be appended
+    if response.status_code != httpx.codes.PARTIAL_CONTENT:
+        return 0
+    match = regex_content_range.match(response.headers.get("Content-Range", ""))
+    if offset == 0 or match is None:
+        return None
+    if int(match.group("start")) != offset or match.group("length") != str(cache["partial"]["length"]):
+        return None
+    return offset
+
+
+def save_partial(cache: dict, url: str, response: httpx.Response):
+    etag = response.headers.get("ETag")
+    cache["partial"] = {
+        "url": url,
+        # weak etags are not allowed in If-Range
+        "etag": etag if etag is not None and not etag.startswith("W/") else None,
+        "last_modified": response.headers.get("Last-Modified"),
+        "length": int(response.headers["Content-Length"]) if "Content-Length" in response.headers else None,
+    }
+    cache.save()
 
-    # download
-    path_tempFile = path_app / f"temp_{cache['remote_version']}"
+
+def discard_download(path_tempFile: Path, cache: dict):
+    # a bad transfer is not resumed, the next attempt starts over
+    cache["partial"] = None
+    cache.save()
     path_tempFile.unlink(missing_ok=True)
-    with open(path_tempFile, "wb") as f:
-        with client.stream("GET", cache["download_url"], follow_redirects=True) as response:
-            if "Content-Length" in response.headers:
-                total = int(response.headers["Content-Length"]) + 1
-                for chunk in response.iter_bytes():
-                    f.write(chunk)
-                    _p_stats[task_id] = (response.num_bytes_downloaded, total)
-            else:
+
+
+def check_length(response: httpx.Response, path_tempFile: Path, cache: dict):
+    length = response.headers.get("Content-Length")
+    if length is not None and response.num_bytes_downloaded != int(length):
+        discard_download(path_tempFile, cache)
+        raise IntegrityError(f"{response.url} sent {response.num_bytes_downloaded} of {length} bytes")
+
+
+def check_digest(digest: str, path_tempFile: Path, cache: dict):
+    # against the digest GitHub publishes for the asset, if any
+    if cache["digest"] is not None and digest != cache["digest"]:
+        discard_download(path_tempFile, cache)
+        raise IntegrityError(f"sha256 of {cache['download_url']} is {digest}, expected {cache['digest']}")
+
+
+class DownloadFile:
+    """The file side of a download, shared by both engines: they stream the response and
+    hand every chunk to `write`.
+
+    Resumes `path_tempFile` from a partial download of the same asset, hashes and reports
+    progress per chunk, and checks the length once the body is complete.
+    """
+
+    def __init__(self, _p_stats: dict, task_id: int, url: str, path_tempFile: Path, cache: dict):
+        self._p_stats = _p_stats
+        self.task_id = task_id
+        self.url = url
+        self.path = path_tempFile
+        self.cache = cache
+        self.offset, self.headers = resume_headers(cache, url, path_tempFile)
+
+    def start(self, response: httpx.Response) -> bool:
+        # False if the range cannot be appended, the download then starts over from byte zero
+        offset = resume_offset(response, self.offset, self.cache)
+        if offset is None:
+            self.cache["partial"] = None
+            self.path.unlink(missing_ok=True)
+            self.offset, self.headers = 0, {}
+            return False
+        if offset == 0:
+            save_partial(self.cache, self.url, response)
+        self.offset = offset
+        self.length = int(response.headers["Content-Length"]) if "Content-Length" in response.headers else None
+        self.hasher = file_digest(self.path) if offset > 0 else hashlib.sha256()
+        self.file = open(self.path, "ab" if offset > 0 else "wb")
+        return True
+
+    def write(self, chunk: bytes, downloaded: int):
+        self.file.write(chunk)
+        self.hasher.update(chunk)
+        completed = self.offset + downloaded
+        self._p_stats[self.task_id] = (completed, self.offset + self.length + 1 if self.length is not None else completed + 1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.size = self.file.tell()
+        self.file.close()
+
+    def finish(self, response: httpx.Response) -> tuple[int, str, str | None]:
+        # (size, sha256, etag) of the downloaded asset
+        check_length(response, self.path, self.cache)
+        self.cache["partial"] = None
+        self.cache.save()
+        return self.size, self.hasher.hexdigest(), response.headers.get("ETag")
+
+
+def download(_p_stats: dict, task_id: int, url: str, path_tempFile: Path, cache: dict) -> tuple[int, str, str | None]:
+    # (size, sha256, etag) of the downloaded asset
+    sink = DownloadFile(_p_stats, task_id, url, path_tempFile, cache)
+    while True:
+        with host_limiter().request(url) as lease, client.stream("GET", url, headers=sink.headers, follow_redirects=True) as response:
+            response.raise_for_status()
+            started = sink.start(response)
+            if started:
+                with sink:
+                    for chunk in response.iter_bytes():
+                        sink.write(chunk, response.num_bytes_downloaded)
+            lease.bytes = response.num_bytes_downloaded
+        if started:
+            return sink.finish(response)
+
+
+def segment_plan(config: dict, args: dict) -> tuple[int, int]:
+    # (segments, min segment size), per script install_args override [worker]
+    segments = args.get("segments", config["worker"].get("segments", 1))
+    min_size = args.get("segment_min_size", config["worker"].get("segment_min_size", 8 << 20))
+    return segments, min_size
+
+
+def split_ranges(length: int, segments: int, min_size: int) -> list[tuple[int, int]]:
+    count = max(1, min(segments, length // max(min_size, 1)))
+    size = -(-length // count)
+    return [(start, min(start + size, length) - 1) for start in range(0, length, size)]
+
+
+def check_segment(response: httpx.Response, start: int, end: int, total: int, etag: str | None):
+    match = regex_content_range.match(response.headers.get("Content-Range", ""))
+    if response.status_code != httpx.codes.PARTIAL_CONTENT or match is None or int(match.group("start")) != start:
+        raise httpx.HTTPError(f"range {start}-{end} not served by {response.url}")
+    # a range of another version of the asset, replaced since the probe
+    if match.group("length") != str(total) or (etag is not None and response.headers.get("ETag") != etag):
+        raise httpx.HTTPError(f"{response.url} changed since the probe")
+
+
+class SegmentedFile:
+    """A download split into byte ranges, each written into its own slice of a preallocated
+    file; shared by both engines, which fetch the ranges concurrently their own way.
+    """
+
+    def __init__(self, _p_stats: dict, task_id: int, path_tempFile: Path, response: httpx.Response, segments: int, min_size: int):
+        self._p_stats = _p_stats
+        self.task_id = task_id
+        self.path = path_tempFile
+        # the probe's final url, ranges are not redirected again
+        self.url, self.etag = str(response.url), response.headers.get("ETag")
+        self.total = int(response.headers.get("Content-Length", 0))
+        self.ranges = []
+        if not response.is_error and response.headers.get("Accept-Ranges") == "bytes" and self.total > 0:
+            self.ranges = split_ranges(self.total, segments, min_size)
+        self.completed = 0
+        self.lock = threading.Lock()
+
+    @property
+    def splittable(self) -> bool:
+        return len(self.ranges) >= 2
+
+    def preallocate(self):
+        with open(self.path, "wb") as f:
+            f.truncate(self.total)
+
+    def headers(self, start: int, end: int) -> dict:
+        # If-Range: a server whose asset changed answers with the whole new one, not a range of it
+        headers = {"Range": f"bytes={start}-{end}"}
+        if self.etag is not None and not self.etag.startswith("W/"):
+            headers["If-Range"] = self.etag
+        return headers
+
+    def open(self, start: int):
+        f = open(self.path, "r+b")
+        f.seek(start)
+        return f
+
+    def write(self, f, chunk: bytes):
+        f.write(chunk)
+        with self.lock:
+            self.completed += len(chunk)
+            self._p_stats[self.task_id] = (self.completed, self.total + 1)
+
+    def check(self, response: httpx.Response, start: int, end: int):
+        if response.num_bytes_downloaded != end - start + 1:
+            raise httpx.HTTPError(f"range {start}-{end} of {self.url} truncated")
+
+    def finish(self) -> tuple[int, str, str | None]:
+        # ranges arrive out of order, hash the assembled file
+        return self.total, file_digest(self.path).hexdigest(), self.etag
+
+
+def download_segmented(_p_stats: dict, task_id: int, url: str, path_tempFile: Path, segments: int, min_size: int) -> tuple[int, str, str | None] | None:
+    # probe, None if the asset cannot be split
+    limiter = host_limiter()
+    with limiter.request(url):
+        response = client.head(url, follow_redirects=True)
+    sink = SegmentedFile(_p_stats, task_id, path_tempFile, response, segments, min_size)
+    if not sink.splittable:
+        return None
+
+    def fetch(start: int, end: int):
+        with sink.open(start) as f:
+            with limiter.request(sink.url) as lease, client.stream("GET", sink.url, headers=sink.headers(start, end)) as response:
+                check_segment(response, start, end, sink.total, sink.etag)
                 for chunk in response.iter_bytes():
-                    f.write(chunk)
-                    total = response.num_bytes_downloaded
-                    _p_stats[task_id] = (total, total + 1)
+                    sink.write(f, chunk)
+                lease.bytes = response.num_bytes_downloaded
+                sink.check(response, start, end)
+
+    sink.preallocate()
+    with ThreadPoolExecutor(max_workers=len(sink.ranges)) as executor:
+        for future in [executor.submit(fetch, start, end) for start, end in sink.ranges]:
+            future.result()
+    return sink.finish()
+
+
+def stored_artifact(store: ArtifactStore, cache: dict) -> tuple[Path | None, str | None]:
+    # (blob, etag the server must still report for it), the etag is None if no request is needed
+    blob = store.find(cache["digest"])
+    if blob is not None:
+        return blob, None
+    # by url, if the server still reports the stored ETag
+    blob, etag = store.lookup(cache["download_url"])
+    if etag is None:
+        return None, None
+    return blob, etag
+
+
+def still_current(response: httpx.Response, etag: str) -> bool:
+    return not response.is_error and response.headers.get("ETag") == etag
+
+
+def find_artifact(store: ArtifactStore, cache: dict) -> Path | None:
+    blob, etag = stored_artifact(store, cache)
+    if blob is None or etag is None:
+        return blob
+    with host_limiter().request(cache["download_url"]):
+        response = client.head(cache["download_url"], follow_redirects=True)
+    return blob if still_current(response, etag) else None
+
+
+def store_download(store: ArtifactStore, path_tempFile: Path, cache: dict, result: tuple[int, str, str | None]) -> Path:
+    # against the published digest, then into the store
+    _, digest, etag = result
+    check_digest(digest, path_tempFile, cache)
+    return store.add(path_tempFile, digest, cache["download_url"], etag)
+
+
+def fetch_artifact(_p_stats: dict, task_id: int, store: ArtifactStore, path_app: Path, config: dict, cache: dict, args: dict) -> Path:
+    # reuse a stored copy of the asset, otherwise download, in parallel ranges if enabled
+    # and supported, or resuming temp_<version> if a previous attempt was interrupted
+    blob = find_artifact(store, cache)
+    if blob is not None:
+        return blob
+    path_tempFile = path_app / f"temp_{cache['remote_version']}"
+    segments, min_size = segment_plan(config, args)
+    result = None
+    with span("download") as attrs:
+        if segments > 1:
+            result = download_segmented(_p_stats, task_id, cache["download_url"], path_tempFile, segments, min_size)
+        if result is None:
+            result = download(_p_stats, task_id, cache["download_url"], path_tempFile, cache)
+        attrs["bytes"] = result[0]
+    return store_download(store, path_tempFile, cache, result)
+
+
+def is_current(cache: dict, latest_version: str, remote_version: str | None) -> bool:
+    # a version `rollback` moved away from is not installed again, only a newer release is
+    return remote_version in (latest_version, cache["rolled_back"])
+
+
+def save_artifact(cache: dict, blob: Path, path_file: Path, path_app: Path):
+    # what verify checks the installed file against, the one it replaces is kept for rollback
+    artifact = {
+        "sha256": blob.name,
+        "size": blob.stat().st_size,
+        "file": path_file.relative_to(path_app).as_posix(),
+    }
+    if cache["artifact"] is not None and cache["artifact"]["file"] != artifact["file"]:
+        cache["previous"] = cache["artifact"]
+    cache["artifact"] = artifact
+    cache["rolled_back"] = None
+    cache.save()
+
+
+def stage_version(blob: Path, store: ArtifactStore, path_remote: Path, save_name: str):
+    # build the version dir aside and move it in with one rename; a failed install leaves
+    # only a temp_ dir behind, which gc removes
+    path_stage = path_remote.with_name(f"temp_{path_remote.name}.stage")
+    with span("stage"):
+        if path_stage.exists():
+            shutil.rmtree(path_stage)
+        path_stage.mkdir()
+        store.link(blob, path_stage / save_name)
+        if path_remote.exists():
+            # a reinstall of the same version, the old dir is only dropped once the new one is in place
+            path_old = path_remote.with_name(f"temp_{path_remote.name}.old")
+            os.replace(path_remote, path_old)
+            os.replace(path_stage, path_remote)
+            shutil.rmtree(path_old)
+        else:
+            os.replace(path_stage, path_remote)
 
-    # install
-    path_tempFile.rename(path_remote / save_name)
+
+def prepare_install(_p_stats: dict, task_id: int, script: Path, config: dict, cache: dict) -> tuple[Path, Path, ArtifactStore]:
+    # (app dir, version dir, store) of an install, before the artifact is fetched
+    _p_stats[task_id] = (0, 1)
+    path_app = Path(config["path"]["data"]) / script.stem
+    path_app.mkdir(parents=True, exist_ok=True)
+    return path_app, path_app / cache["remote_version"], ArtifactStore(config)
+
+
+def finish_install(_p_stats: dict, task_id: int, blob: Path, store: ArtifactStore, path_app: Path, path_remote: Path, cache: dict, save_name: str):
+    total = blob.stat().st_size
+    stage_version(blob, store, path_remote, save_name)
+    save_artifact(cache, blob, path_remote / save_name, path_app)
     update_link(path_remote)
     _p_stats[task_id] = (total + 1, total + 1)
 
 
+def single_install_move(_p_stats: dict, task_id: int, script: Path, config: dict, cache: dict, args: dict):
+    path_app, path_remote, store = prepare_install(_p_stats, task_id, script, config, cache)
+    # a retried download resumes from what the failed attempt wrote
+    blob = RetryPolicy(config).call(fetch_artifact, _p_stats, task_id, store, path_app, config, cache, args)
+    finish_install(_p_stats, task_id, blob, store, path_app, path_remote, cache, args["save_name"])
+
+
 def single_uninstall(_p_stats: dict, task_id: int, script: Path, config: dict, cache: dict):
     # args
     path_app = Path(config["path"]["data"]) / script.stem
@@ -195,8 +581,9 @@ def grant(files: list[Path], user: int = None, group: int = None, mode: int = No
     if group == -1:
         group = os.getgid()
 
-    for file in files:
-        if (user is not None) and (group is not None):
-            file.resolve().chown(user, group)
-        if mode is not None:
-            file.resolve().chmod(mode)
+    with span("grant"):
+        for file in files:
+            if (user is not None) and (group is not None):
+                file.resolve().chown(user, group)
+            if mode is not None:
+                file.resolve().chmod(mode)
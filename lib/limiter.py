@@ -0,0 +1,192 @@
+import asyncio
+import multiprocessing
+import time
+import zlib
+from contextlib import asynccontextmanager, contextmanager
+from urllib.parse import urlsplit
+
+import httpx
+
+# per host slot: key, active, limit, next_time, pace_interval, pace_until, blocked_until, window_bytes, window_start, throughput, step, peak
+FIELDS = 12
+KEY, ACTIVE, LIMIT, NEXT_TIME, PACE_INTERVAL, PACE_UNTIL, BLOCKED_UNTIL, WINDOW_BYTES, WINDOW_START, THROUGHPUT, STEP, PEAK = range(FIELDS)
+# seconds of downloads measured before the limit is adjusted
+WINDOW = 1.0
+# seconds between polls while a host is at its concurrency limit
+POLL = 0.02
+
+# reserve below 1 is a fraction of the host's X-RateLimit-Limit, else a number of requests
+DEFAULT_HOST = {"concurrency": 8, "rate": 0, "max_concurrency": 16, "reserve": 0.1}
+
+# limiter of the current pool, set by the pool in the parent and by the worker initializer
+_limiter = None
+
+
+def attach_limiter(limiter: "HostLimiter"):
+    global _limiter
+    _limiter = limiter
+
+
+def host_limiter() -> "HostLimiter":
+    global _limiter
+    if _limiter is None:
+        _limiter = HostLimiter({}, 1)
+    return _limiter
+
+
+class Lease:
+    def __init__(self, host: str):
+        self.host = host
+        # bytes transferred under this lease, counted towards the host's throughput
+        self.bytes = 0
+
+
+class HostLimiter:
+    """Concurrency and request-rate budgets per host, shared by the parent and every worker.
+
+    Each host (`[hosts."<name>"]`, else `[hosts.default]`) gets at most `concurrency`
+    requests in flight and at most `rate` request starts per second (0 = unlimited). GitHub's
+    `X-RateLimit-Remaining`/`Reset` are read from every response but a 304: below `reserve`
+    remaining requests the rest are spread evenly until the reset, at 0 the host waits for it
+    and only a reset further off than `backoff_max` fails the request. Hosts that
+    serve downloads adapt their concurrency between 1 and `max_concurrency`: the first download
+    brings the limit down to `callers` (the pool size, or the async engine's download limit),
+    and from there it steps towards whatever gave more throughput, in windows where the limit
+    held requests back.
+    """
+
+    def __init__(self, config: dict, callers: int, size: int = 64):
+        hosts = config.get("hosts", {})
+        self.default = {**DEFAULT_HOST, **hosts.get("default", {})}
+        self.hosts = {k: {**self.default, **v} for k, v in hosts.items() if k != "default"}
+        self.max_wait: float = config.get("http", {}).get("backoff_max", 60.0)
+        # most requests the callers of this process can have in flight at once
+        self.callers = callers
+        self.size = size
+        self.slots = multiprocessing.RawArray("d", size * FIELDS)
+        self.lock = multiprocessing.Lock()
+
+    def plan(self, host: str) -> dict:
+        return self.hosts.get(host, self.default)
+
+    def _slot(self, host: str) -> int:
+        # open addressing on the host's crc32, under the lock
+        key = zlib.crc32(host.encode()) + 1
+        index = key % self.size
+        for _ in range(self.size):
+            base = index * FIELDS
+            if self.slots[base + KEY] == key:
+                return base
+            if self.slots[base + KEY] == 0:
+                self.slots[base + KEY] = key
+                self.slots[base + LIMIT] = self.plan(host)["concurrency"]
+                self.slots[base + STEP] = 1
+                return base
+            index = (index + 1) % self.size
+        raise Exception(f"more than {self.size} hosts in one run")
+
+    def _try_acquire(self, host: str) -> tuple[float, bool]:
+        # (0, False) if a request may start now, else (seconds to wait before trying again,
+        # whether the host's quota is used up)
+        now = time.time()
+        with self.lock:
+            s = self._slot(host)
+            if self.slots[s + BLOCKED_UNTIL] > now:
+                return self.slots[s + BLOCKED_UNTIL] - now, True
+            if self.slots[s + ACTIVE] >= self.slots[s + LIMIT]:
+                # a request held back, the limit is what bounds the host
+                self.slots[s + PEAK] = max(self.slots[s + PEAK], self.slots[s + LIMIT])
+                return POLL, False
+            if self.slots[s + NEXT_TIME] > now:
+                return self.slots[s + NEXT_TIME] - now, False
+            rate = self.plan(host)["rate"]
+            interval = 1 / rate if rate > 0 else 0.0
+            if now < self.slots[s + PACE_UNTIL]:
+                interval = max(interval, self.slots[s + PACE_INTERVAL])
+            self.slots[s + ACTIVE] += 1
+            self.slots[s + PEAK] = max(self.slots[s + PEAK], self.slots[s + ACTIVE])
+            self.slots[s + NEXT_TIME] = now + interval
+            return 0.0, False
+
+    def _release(self, lease: Lease):
+        now = time.time()
+        with self.lock:
+            s = self._slot(lease.host)
+            self.slots[s + ACTIVE] -= 1
+            if lease.bytes == 0:
+                return
+            if self.slots[s + WINDOW_START] == 0:
+                # first download of the host, a limit above what the callers reach bounds nothing
+                self.slots[s + WINDOW_START] = now
+                self.slots[s + LIMIT] = min(self.slots[s + LIMIT], max(self.callers, 1))
+            self.slots[s + WINDOW_BYTES] += lease.bytes
+            elapsed = now - self.slots[s + WINDOW_START]
+            if elapsed < WINDOW:
+                return
+            # hill climb: keep stepping while throughput improves, turn around when it drops;
+            # only a window where the limit was reached says anything about it
+            throughput = self.slots[s + WINDOW_BYTES] / elapsed
+            if self.slots[s + PEAK] >= self.slots[s + LIMIT]:
+                if throughput < self.slots[s + THROUGHPUT] * 0.95:
+                    self.slots[s + STEP] = -self.slots[s + STEP]
+                limit = self.slots[s + LIMIT] + self.slots[s + STEP]
+                self.slots[s + LIMIT] = min(max(limit, 1), self.plan(lease.host)["max_concurrency"])
+            self.slots[s + THROUGHPUT] = throughput
+            self.slots[s + PEAK] = self.slots[s + ACTIVE]
+            self.slots[s + WINDOW_BYTES] = 0
+            self.slots[s + WINDOW_START] = now
+
+    def reserve(self, host: str, response: httpx.Response) -> float:
+        # requests kept in hand before pacing starts
+        reserve = self.plan(host)["reserve"]
+        if reserve >= 1:
+            return reserve
+        limit = response.headers.get("X-RateLimit-Limit", "")
+        return reserve * int(limit) if limit.isdigit() else 0
+
+    def observe(self, url: str, response: httpx.Response):
+        # pace the host by the quota it reports; a 304 costs no quota, so it changes nothing
+        if response.status_code == 304:
+            return
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        if remaining is None or reset is None or not remaining.isdigit() or not reset.isdigit():
+            return
+        host, remaining, reset = urlsplit(url).hostname, int(remaining), int(reset)
+        now = time.time()
+        if reset <= now or (remaining > 0 and remaining >= self.reserve(host, response)):
+            return
+        with self.lock:
+            s = self._slot(host)
+            if remaining == 0:
+                self.slots[s + BLOCKED_UNTIL] = max(self.slots[s + BLOCKED_UNTIL], reset)
+            else:
+                self.slots[s + PACE_UNTIL] = reset
+                self.slots[s + PACE_INTERVAL] = (reset - now) / remaining
+
+    def _wait(self, host: str, delay: float, blocked: bool) -> float:
+        # pacing and the concurrency cap only delay a request, a used up quota fails it
+        # when the reset is further off than backoff_max
+        if blocked and delay > self.max_wait:
+            raise Exception(f"{host} is rate limited for another {delay:.0f}s")
+        return min(delay, 1.0)
+
+    @contextmanager
+    def request(self, url: str):
+        lease = Lease(urlsplit(url).hostname)
+        while (wait := self._try_acquire(lease.host))[0] > 0:
+            time.sleep(self._wait(lease.host, *wait))
+        try:
+            yield lease
+        finally:
+            self._release(lease)
+
+    @asynccontextmanager
+    async def request_async(self, url: str):
+        lease = Lease(urlsplit(url).hostname)
+        while (wait := self._try_acquire(lease.host))[0] > 0:
+            await asyncio.sleep(self._wait(lease.host, *wait))
+        try:
+            yield lease
+        finally:
+            self._release(lease)
@@ -113,6 +113,15 @@ def log_list(items: list[str]):
         console.print(f"+ {item}", style="bright_cyan")
 
 
+def log_table(columns: list[str], rows: list[list[str]]):
+    from rich.table import Table
+
+    table = Table(*columns, header_style="bright_cyan bold", box=None, padding=(0, 2, 0, 0))
+    for row in rows:
+        table.add_row(*row)
+    console.print(table)
+
+
 def log_error(msg: str):
     console.print(f"Error: {msg}", style="light_coral")
     exit(1)
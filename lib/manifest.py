@@ -0,0 +1,71 @@
+import re
+import tomllib
+from pathlib import Path
+
+from lib.helper import github_api, grant, single_install_move, single_uninstall, single_update
+
+DEFAULT_REGEX_VERSION = r"(?P<version>(\d|\.)+)"
+
+
+class Manifest:
+    """A script declared in `scripts/<name>.toml` for the common GitHub-release case.
+
+    Exposes the same hooks as a script module, so everything that runs a script can
+    run a manifest. Keys: `github_repo`, `regex_asset`, `regex_version` (optional),
+    `save_name` (`{name}` is the script name) and optionally `segments`/`segment_min_size`,
+    `depends` (names of scripts to install first), `mode` (e.g. `0o755`, applied to the
+    installed file as the post-install hook) and `interval` (seconds between the daemon's checks).
+    """
+
+    def __init__(self, path: Path, data: dict):
+        self.path = path
+        self.github_repo: str = data["github_repo"]
+        self.regex_asset = re.compile(data["regex_asset"])
+        self.regex_version = re.compile(data.get("regex_version", DEFAULT_REGEX_VERSION))
+        self.save_name: str = data["save_name"]
+        self.install_extra = {x: data[x] for x in ("segments", "segment_min_size") if x in data}
+        self.depends: list[str] = data.get("depends", [])
+        # scripts without one are checked every [daemon] interval
+        if "interval" in data:
+            self.interval: float = data["interval"]
+        # only manifests with a mode get the hook, others skip the post-install step
+        if "mode" in data:
+            self.mode: int = data["mode"]
+            self.post_install = self.grant_mode
+
+    def update_args(self, script: Path, config: dict) -> dict:
+        return {
+            "url": f"{github_api(config)}/repos/{self.github_repo}/releases/latest",
+            "github": True,
+            "regex_asset": self.regex_asset,
+            "regex_version": self.regex_version,
+        }
+
+    def update(self, _p_stats: dict, task_id: int, script: Path, config: dict, cache: dict):
+        single_update(_p_stats, task_id, script, config, cache, self.update_args(script, config))
+
+    def install_args(self, script: Path, config: dict) -> dict:
+        return {
+            "save_name": self.save_name.format(name=script.stem),
+            **self.install_extra,
+        }
+
+    def grant_mode(self, script: Path, config: dict):
+        path_app = Path(config["path"]["data"]) / script.stem
+        grant(path_app.glob(f"**/{self.install_args(script, config)['save_name']}"), mode=self.mode)
+
+    def install(self, _p_stats: dict, task_id: int, script: Path, config: dict, cache: dict):
+        single_install_move(_p_stats, task_id, script, config, cache, self.install_args(script, config))
+        if hasattr(self, "post_install"):
+            self.post_install(script, config)
+
+    def uninstall(self, _p_stats: dict, task_id: int, script: Path, config: dict, cache: dict):
+        single_uninstall(_p_stats, task_id, script, config, cache)
+
+    def upgrade(self, _p_stats: dict, task_id: int, script: Path, config: dict, cache: dict):
+        self.install(_p_stats, task_id, script, config, cache)
+
+
+def load_manifest(script: Path) -> Manifest:
+    with open(script, "rb") as f:
+        return Manifest(script, tomllib.load(f))
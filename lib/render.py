@@ -0,0 +1,229 @@
+import time
+
+from rich import filesize, progress
+from rich.console import Group
+from rich.live import Live
+from rich.progress_bar import ProgressBar
+from rich.table import Table
+
+from lib.log import console
+
+# progress.mode "auto" switches to compact above this many scripts
+COMPACT_OVER = 20
+# active downloads the compact renderer shows
+TOP = 5
+# seconds between the plain renderer's status lines
+INTERVAL = 10.0
+
+
+class SummaryProgress(progress.Progress):
+    def __init__(self, *columns, **kwargs):
+        # no live display while the console is silenced, e.g. for --output json
+        super().__init__(*columns, disable=console.quiet, **kwargs)
+        # built once, get_renderables runs on every refresh
+        self.summary_columns = {}
+        self.download_columns = (
+            progress.TextColumn("[blue]{task.description}", justify="right"),
+            progress.BarColumn(bar_width=None),
+            "[progress.percentage][steel_blue3]{task.percentage:>3.1f}%",
+            "•",
+            progress.DownloadColumn(),
+            "•",
+            progress.TransferSpeedColumn(),
+            "•",
+            progress.TimeRemainingColumn(),
+        )
+
+    def get_summary_columns(self, plural: bool) -> tuple:
+        if plural not in self.summary_columns:
+            self.summary_columns[plural] = (
+                progress.TextColumn(
+                    "[aquamarine3]Downloading file" + ("s" if plural else ""),
+                    justify="right",
+                ),
+                progress.BarColumn(bar_width=None),
+                "[progress.percentage][steel_blue1]{task.percentage:>3.1f}%",
+                "•",
+                progress.TextColumn(
+                    "[aquamarine3]{task.completed} of {task.total} completed",
+                    justify="right",
+                ),
+            )
+        return self.summary_columns[plural]
+
+    def get_renderables(self):
+        downloads = []
+        for task in self.tasks:
+            if task.fields.get("progress_type") == "summary":
+                self.columns = self.get_summary_columns(task.total > 1)
+                yield self.make_tasks_table([task])
+            elif task.visible:
+                downloads.append(task)
+        # every download in one table, instead of one table per task
+        if len(downloads) > 0:
+            self.columns = self.download_columns
+            yield self.make_tasks_table(downloads)
+
+
+class TaskState:
+    __slots__ = ("description", "completed", "total", "visible", "progress_type", "started")
+
+    def __init__(self, description: str, total: float | None, visible: bool, progress_type: str | None):
+        self.description = description
+        self.completed = 0
+        self.total = total
+        self.visible = visible
+        self.progress_type = progress_type
+        self.started = None
+
+
+class LightProgress:
+    """Progress bookkeeping without a rich task per script, the base of the compact and plain renderers.
+
+    Takes the calls the commands make on a rich Progress (`add_task`, `update`, the context
+    manager); task ids count up from 0 like rich's, as the progress channel is indexed by them.
+    """
+
+    def __init__(self):
+        self.tasks = []
+        self.summary = None
+
+    def add_task(self, description: str, total: float | None = None, visible: bool = True, progress_type: str | None = None, **fields) -> int:
+        if progress_type == "summary":
+            self.summary = len(self.tasks)
+        self.tasks.append(TaskState(description, total, visible, progress_type))
+        return len(self.tasks) - 1
+
+    def update(self, task_id: int, completed: float | None = None, total: float | None = None, visible: bool | None = None, **fields):
+        task = self.tasks[task_id]
+        if completed is not None:
+            if task.started is None and completed > 0:
+                task.started = time.monotonic()
+            task.completed = completed
+        if total is not None:
+            task.total = total
+        if visible is not None:
+            task.visible = visible
+
+    def active(self) -> list[TaskState]:
+        # running downloads, the most bytes remaining first
+        tasks = [x for x in self.tasks if x.progress_type != "summary" and x.visible and x.total]
+        return sorted(tasks, key=lambda x: x.total - x.completed, reverse=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class CompactProgress(LightProgress):
+    """One aggregate bar plus the `top` active downloads with the most bytes remaining."""
+
+    def __init__(self, top: int = TOP, refresh_per_second: float = 10):
+        super().__init__()
+        self.top = top
+        self.live = Live(get_renderable=self.render, console=console, refresh_per_second=refresh_per_second, transient=False)
+
+    def render(self) -> Group:
+        rows = []
+        if self.summary is not None:
+            task = self.tasks[self.summary]
+            total = task.total or 0
+            active = self.active()
+            grid = Table.grid(padding=(0, 1), expand=True)
+            grid.add_column(justify="right")
+            grid.add_column(ratio=1)
+            grid.add_column(justify="right")
+            grid.add_row(
+                "[aquamarine3]Downloading files",
+                ProgressBar(total=total or None, completed=task.completed),
+                f"[aquamarine3]{task.completed} of {total} completed, {len(active)} active",
+            )
+            rows.append(grid)
+            if len(active) > 0:
+                now = time.monotonic()
+                table = Table.grid(padding=(0, 1), expand=True)
+                table.add_column(justify="right")
+                table.add_column(ratio=1)
+                table.add_column(justify="right")
+                table.add_column(justify="right")
+                for x in active[: self.top]:
+                    speed = x.completed / (now - x.started) if x.started is not None and now > x.started else 0
+                    table.add_row(
+                        f"[blue]{x.description}",
+                        ProgressBar(total=x.total, completed=x.completed),
+                        f"{filesize.decimal(int(x.completed))}/{filesize.decimal(int(x.total))}",
+                        f"[progress.data.speed]{filesize.decimal(int(speed))}/s",
+                    )
+                rows.append(table)
+        return Group(*rows)
+
+    def __enter__(self):
+        if not console.quiet:
+            self.live.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.live.is_started:
+            self.live.stop()
+
+
+class PlainProgress(LightProgress):
+    """Status lines at most every `interval` seconds, for output that is not a terminal."""
+
+    def __init__(self, interval: float = INTERVAL):
+        super().__init__()
+        self.interval = interval
+        self.printed = None
+        self.last = None
+
+    def status(self) -> str:
+        task = self.tasks[self.summary]
+        active = self.active()
+        line = f"{task.completed} of {task.total or 0} completed"
+        if len(active) > 0:
+            completed, total = sum(x.completed for x in active), sum(x.total for x in active)
+            line += f", {len(active)} downloading {filesize.decimal(int(completed))}/{filesize.decimal(int(total))}"
+        return line
+
+    def emit(self, force: bool = False):
+        if self.summary is None:
+            return
+        now = time.monotonic()
+        if not force and self.printed is not None and now - self.printed < self.interval:
+            return
+        line = self.status()
+        # nothing new since the last line
+        if line == self.last:
+            return
+        self.printed, self.last = now, line
+        console.print(line, highlight=False, soft_wrap=True)
+
+    def update(self, task_id: int, completed: float | None = None, total: float | None = None, visible: bool | None = None, **fields):
+        super().update(task_id, completed, total, visible)
+        # the summary is updated first on every refresh, the tasks follow
+        if task_id == self.summary:
+            self.emit()
+
+    def __exit__(self, *exc):
+        self.emit(force=True)
+
+
+def progress_mode(config: dict, count: int) -> str:
+    mode = config.get("progress", {}).get("mode", "auto")
+    if mode != "auto":
+        return mode
+    if not console.is_terminal:
+        return "plain"
+    return "compact" if count > config.get("progress", {}).get("compact_over", COMPACT_OVER) else "rich"
+
+
+def get_progress(config: dict, count: int, *columns, refresh_per_second: float = 10) -> SummaryProgress | LightProgress:
+    # rich for a few scripts in a terminal, compact for many, plain when piped to a file
+    mode = progress_mode(config, count)
+    if mode == "compact":
+        return CompactProgress(config.get("progress", {}).get("top", TOP), refresh_per_second)
+    if mode == "plain":
+        return PlainProgress(config.get("progress", {}).get("interval", INTERVAL))
+    return SummaryProgress(*columns, refresh_per_second=refresh_per_second)
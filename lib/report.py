@@ -0,0 +1,201 @@
+import logging
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+import orjson
+
+from lib.log import console, log
+from lib.scheduler import TaskError
+
+# report of the current run, set by main; None leaves the commands' reporting a no-op
+_report = None
+
+
+class Report:
+    """Per-script outcomes of a run, for `--output json|ndjson` and the metrics textfile.
+
+    Commands add one result per script (action, installed and remote version, error);
+    durations and downloaded bytes are filled in from the run's spans. In json/ndjson
+    mode the console is silenced and log messages are kept in the document instead.
+    """
+
+    def __init__(self, output: str, textfile: str | None = None):
+        self.output = output
+        self.textfile = Path(textfile) if textfile else None
+        self.started = time.time()
+        self.results = []
+        self.messages = []
+        # results already written as ndjson lines
+        self.emitted = 0
+        if output != "rich":
+            console.quiet = True
+            log.addHandler(ReportHandler(self))
+
+    def add(self, command: str, script: str, action: str, installed: str | None = None, remote: str | None = None, error: Exception | None = None):
+        result = {
+            "command": command,
+            "script": script,
+            "action": action,
+            # "None" is how the commands spell not installed
+            "installed": None if installed in (None, "None") else installed,
+            "remote": remote,
+            "bytes": None,
+            "duration": None,
+            "stage": None,
+            "error": None,
+        }
+        if isinstance(error, TaskError):
+            result["stage"], result["error"] = error.stage, error.error
+        elif error is not None:
+            result["error"] = f"{type(error).__name__}: {error}"
+        self.results.append(result)
+
+    def measure(self, spans: list[dict]):
+        # duration from the first to the last span of the command's tasks, nested ones included,
+        # and the bytes downloaded within them
+        tasks = {}
+        for x in spans:
+            if x.get("task"):
+                key = (x["name"], x["script"])
+                start, end = tasks.get(key, (x["start"], x["end"]))
+                tasks[key] = (min(start, x["start"]), max(end, x["end"]))
+        for result in self.results:
+            if result["duration"] is not None or (result["command"], result["script"]) not in tasks:
+                continue
+            start, end = tasks[(result["command"], result["script"])]
+            result["duration"] = round(end - start, 6)
+            result["bytes"] = sum(x.get("bytes", 0) for x in spans if x["name"] == "download" and x["script"] == result["script"] and start <= x["start"] <= end)
+
+    def reset(self):
+        # e.g. after each cycle of the daemon, which writes a report per cycle
+        self.started = time.time()
+        self.results = []
+        self.messages = []
+        self.emitted = 0
+
+    def flush(self, spans: list[dict]):
+        # after each command, ndjson writes its results right away
+        if self.output != "ndjson":
+            return
+        self.measure(spans)
+        for result in self.results[self.emitted :]:
+            write_line({"type": "result", **result})
+        self.emitted = len(self.results)
+
+    def summary(self, code: int) -> dict:
+        return {
+            "started": self.started,
+            "duration": round(time.time() - self.started, 6),
+            "exit_code": code,
+            "failed": sum(1 for x in self.results if x["error"] is not None),
+            "messages": self.messages,
+        }
+
+    def finish(self, spans: list[dict], code: int):
+        self.measure(spans)
+        if self.output == "json":
+            write_line({**self.summary(code), "results": self.results})
+        elif self.output == "ndjson":
+            self.flush(spans)
+            write_line({"type": "summary", **self.summary(code)})
+        if self.textfile is not None:
+            write_textfile(self, code)
+
+
+class ReportHandler(logging.Handler):
+    def __init__(self, report: Report):
+        super().__init__(logging.WARNING)
+        self.report = report
+
+    def emit(self, record: logging.LogRecord):
+        self.report.messages.append({"level": record.levelname.lower(), "message": record.getMessage()})
+
+
+def write_line(data: dict):
+    sys.stdout.buffer.write(orjson.dumps(data) + b"\n")
+    sys.stdout.flush()
+
+
+def start_report(output: str, textfile: str | None = None) -> Report | None:
+    global _report
+    if output == "rich" and not textfile:
+        return None
+    _report = Report(output, textfile)
+    return _report
+
+
+def current_report() -> Report | None:
+    return _report
+
+
+def report(command: str, script: str, action: str, installed: str | None = None, remote: str | None = None, error: Exception | None = None):
+    if _report is not None:
+        _report.add(command, script, action, installed, remote, error)
+
+
+def report_errors(command: str, errors: list[Exception]):
+    for error in errors:
+        report(command, error.script.stem if isinstance(error, TaskError) else "", "failed", error=error)
+
+
+def report_skipped(command: str, scripts: list[Path], results: list, errors: list[Exception]):
+    # scripts a command had nothing to do for, neither a result nor an error
+    done = {x[0] for x in results} | {x.script.stem for x in errors if isinstance(x, TaskError)}
+    for script in scripts:
+        if script.stem not in done:
+            report(command, script.stem, "skipped")
+
+
+def label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def previous_counter(path: Path, name: str) -> int:
+    # counters carry over from the textfile of the previous run
+    if not path.exists():
+        return 0
+    match = re.search(rf"^{name} (\d+)$", path.read_text(encoding="utf8"), re.MULTILINE)
+    return int(match.group(1)) if match is not None else 0
+
+
+def write_textfile(report: Report, code: int):
+    # Prometheus text format for node_exporter's textfile collector, replaced atomically
+    path = report.textfile
+    runs = previous_counter(path, "mapo_runs_total") + 1
+    failures = previous_counter(path, "mapo_run_failures_total") + (code != 0)
+    metrics = [
+        ("mapo_runs_total", "counter", "Runs of mapo.", [("", runs)]),
+        ("mapo_run_failures_total", "counter", "Runs of mapo that exited with an error.", [("", failures)]),
+        ("mapo_last_run_timestamp_seconds", "gauge", "Unix time the last run finished.", [("", round(time.time(), 3))]),
+        ("mapo_last_run_duration_seconds", "gauge", "Wall time of the last run.", [("", round(time.time() - report.started, 3))]),
+        ("mapo_last_run_success", "gauge", "Whether the last run exited without an error.", [("", int(code == 0))]),
+    ]
+    actions, downloaded, durations, available = {}, {}, [], {}
+    for x in report.results:
+        key = f'command="{label(x["command"])}",action="{label(x["action"])}"'
+        actions[key] = actions.get(key, 0) + 1
+        command = f'command="{label(x["command"])}"'
+        downloaded[command] = downloaded.get(command, 0) + (x["bytes"] or 0)
+        if x["duration"] is not None:
+            durations.append((f'{command},script="{label(x["script"])}"', x["duration"]))
+        if x["command"] in ("update", "sync") and x["remote"] is not None:
+            available[f'script="{label(x["script"])}"'] = int(x["action"] == "available")
+    metrics += [
+        ("mapo_scripts", "gauge", "Scripts of the last run by command and outcome.", list(actions.items())),
+        ("mapo_downloaded_bytes", "gauge", "Bytes downloaded in the last run.", list(downloaded.items())),
+        ("mapo_script_duration_seconds", "gauge", "Time spent on each script in the last run.", durations),
+        ("mapo_update_available", "gauge", "Whether a newer version was found in the last run.", list(available.items())),
+    ]
+    lines = []
+    for name, kind, help, samples in metrics:
+        if len(samples) == 0:
+            continue
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+        lines += [f"{name}{{{labels}}} {value}" if labels else f"{name} {value}" for labels, value in samples]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path_temp = path.with_name(f".{path.name}.tmp")
+    path_temp.write_text("\n".join(lines) + "\n", encoding="utf8")
+    os.replace(path_temp, path)
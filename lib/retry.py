@@ -0,0 +1,91 @@
+import asyncio
+import email.utils
+import random
+import time
+
+import httpx
+
+from lib.store import IntegrityError
+
+# statuses worth another attempt, GitHub's rate-limit 403 is handled separately
+RETRY_STATUS = (408, 429, 500, 502, 503, 504)
+
+
+def http_timeout(config: dict) -> httpx.Timeout:
+    # seconds to connect, and to wait for each read/write/pool slot
+    http = config.get("http", {})
+    return httpx.Timeout(http.get("read_timeout", 30.0), connect=http.get("connect_timeout", 10.0))
+
+
+def rate_limited(response: httpx.Response) -> bool:
+    # GitHub answers an exhausted quota or a secondary limit with 403
+    return response.headers.get("X-RateLimit-Remaining") == "0" or "Retry-After" in response.headers
+
+
+def server_delay(response: httpx.Response) -> float | None:
+    # seconds the server asks to wait, None if it does not say
+    retry_after = response.headers.get("Retry-After")
+    if retry_after is not None:
+        if retry_after.isdigit():
+            return float(retry_after)
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+    reset = response.headers.get("X-RateLimit-Reset")
+    if response.headers.get("X-RateLimit-Remaining") == "0" and reset is not None and reset.isdigit():
+        return max(0.0, int(reset) - time.time())
+    return None
+
+
+class RetryPolicy:
+    """Bounded retries with jittered exponential backoff for transient HTTP failures.
+
+    Retries timeouts, dropped connections, truncated or corrupt transfers, 408/429/5xx and
+    rate-limited 403s, up to `[http] retries` times. Waits `backoff * 2^attempt` seconds with full jitter,
+    or what `Retry-After`/`X-RateLimit-Reset` ask for; a server wait longer than
+    `backoff_max` is not slept through, the error is raised instead.
+    """
+
+    def __init__(self, config: dict):
+        http = config.get("http", {})
+        self.retries: int = http.get("retries", 3)
+        self.backoff: float = http.get("backoff", 1.0)
+        self.backoff_max: float = http.get("backoff_max", 60.0)
+
+    def delay(self, attempt: int, error: Exception) -> float | None:
+        # seconds to wait before the next attempt, None to give up
+        if attempt >= self.retries or not isinstance(error, (httpx.HTTPError, IntegrityError)):
+            return None
+        if isinstance(error, httpx.HTTPStatusError):
+            response = error.response
+            if response.status_code not in RETRY_STATUS and not (response.status_code == httpx.codes.FORBIDDEN and rate_limited(response)):
+                return None
+            wait = server_delay(response)
+            if wait is not None:
+                return wait if wait <= self.backoff_max else None
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2**attempt))
+
+    def call(self, fn, *args):
+        attempt = 0
+        while True:
+            try:
+                return fn(*args)
+            except Exception as e:
+                delay = self.delay(attempt, e)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+
+    async def call_async(self, fn, *args):
+        attempt = 0
+        while True:
+            try:
+                return await fn(*args)
+            except Exception as e:
+                delay = self.delay(attempt, e)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
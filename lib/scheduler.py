@@ -0,0 +1,94 @@
+from concurrent.futures import Future, wait
+from pathlib import Path
+
+from rich import progress
+
+from lib.log import log_table, log_title
+
+REFRESH_PER_SECOND = 5
+
+
+class TaskError(Exception):
+    """A script that failed at one stage of a command, with the error that stopped it."""
+
+    def __init__(self, stage: str, script: Path, error: Exception | str):
+        self.stage = stage
+        self.script = script
+        # kept as text, so the error pickles back from a worker whatever it was
+        self.error = error if isinstance(error, str) else f"{type(error).__name__}: {error}"
+        super().__init__(f"during {stage}: {self.error}\n{script=}")
+
+    def __reduce__(self):
+        return (TaskError, (self.stage, self.script, self.error))
+
+
+def first_error(errors: list[Exception]) -> Exception:
+    # report a root cause rather than a dependent that failed because of it
+    return next((x for x in errors if not (isinstance(x, TaskError) and x.stage == "depends")), errors[0])
+
+
+def split_results(futures: list) -> tuple[list, list[Exception]]:
+    # (results, errors) of finished futures or tasks, for keep-going runs
+    results, errors = [], []
+    for future in futures:
+        if future.cancelled():
+            continue
+        if future.exception() is not None:
+            errors.append(future.exception())
+        else:
+            results.append(future.result())
+    return results, errors
+
+
+def log_failures(errors: list[Exception]):
+    if len(errors) == 0:
+        return
+    log_title(f"{len(errors)} failed")
+    rows = []
+    for error in errors:
+        if isinstance(error, TaskError):
+            rows.append([error.script.stem, error.stage, error.error])
+        else:
+            rows.append(["", "", f"{type(error).__name__}: {error}"])
+    log_table(["script", "stage", "error"], rows)
+
+
+def refresh_progress(_prog: progress.Progress, _p_stats, p_task_summary: int, finished: int, total: int):
+    _prog.update(
+        p_task_summary,
+        completed=finished,
+        total=total,
+    )
+    for task_id, (completed, total) in _p_stats.items():
+        _prog.update(
+            task_id,
+            completed=completed,
+            total=total,
+            visible=completed < total,
+        )
+
+
+def wait_futures(
+    _prog: progress.Progress,
+    _p_stats,
+    p_task_summary: int,
+    futures: list[Future],
+    refresh_per_second: float = REFRESH_PER_SECOND,
+    keep_going: bool = False,
+):
+    # block on completion, waking once per refresh tick to publish progress; the first error
+    # cancels what has not started, unless keep_going lets every other task finish
+    interval = 1 / refresh_per_second
+    pending = set(futures)
+    while True:
+        done, pending = wait(pending, timeout=interval)
+        errors = [x.exception() for x in done if not x.cancelled() and x.exception() is not None]
+        if len(errors) > 0 and not keep_going:
+            for future in pending:
+                future.cancel()
+            raise first_error(errors)
+        refresh_progress(_prog, _p_stats, p_task_summary, len(futures) - len(pending), len(futures))
+        if len(pending) == 0:
+            break
+
+    return futures
@@ -0,0 +1,221 @@
+import cProfile
+import os
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+from multiprocessing.util import Finalize
+from pathlib import Path
+
+import orjson
+
+from lib.log import log_list, log_table, log_title
+
+# spans of the task running in this context, None outside a profiled task
+_task: ContextVar[list | None] = ContextVar("spans", default=None)
+# profile of the current run, set by main in the parent and by the worker initializer
+_profile = None
+
+# span names shown as columns of the timing table, in the order a task runs them
+COLUMNS = ("load_script", "release", "download", "stage", "link", "grant")
+
+
+class Profile:
+    """Spans of every task of a run, gathered in the parent for the timing table and trace.
+
+    Workers send the spans of each task back with its result, and spans taken outside a
+    task (e.g. the initializer preloading scripts) with the next one. With `cpu`, the parent
+    and every worker also run cProfile and dump it to `<path>/<pid>.prof` when they exit.
+    """
+
+    def __init__(self, path: Path, cpu: bool = False):
+        self.path = path
+        self.cpu = cpu
+        self.spans = []
+        self.lock = threading.Lock()
+        self.profiler = None
+
+    def __reduce__(self):
+        # workers only need where to dump, their spans travel with the results
+        return (Profile, (self.path, self.cpu))
+
+    def add(self, spans: list[dict]):
+        with self.lock:
+            self.spans += spans
+
+    def start_cpu(self):
+        if not self.cpu:
+            return
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    def dump_cpu(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.path / f"{os.getpid()}.prof")
+            self.profiler = None
+
+
+def start_profile(path: Path, cpu: bool = False) -> Profile:
+    global _profile
+    _profile = Profile(path, cpu)
+    _profile.start_cpu()
+    return _profile
+
+
+def attach_profile(profile: Profile | None):
+    # in a worker, dumped by multiprocessing's exit handlers once the pool shuts it down
+    global _profile
+    if profile is None:
+        _profile = None
+        return
+    if profile.profiler is not None:
+        # a forked worker inherits the parent's running profiler
+        profile.profiler.disable()
+    _profile = Profile(profile.path, profile.cpu)
+    if _profile.cpu:
+        _profile.start_cpu()
+        Finalize(_profile, _profile.dump_cpu, exitpriority=10)
+
+
+def current_profile() -> Profile | None:
+    return _profile
+
+
+@contextmanager
+def span(name: str, **attrs):
+    # time a step of the running task, attrs can still be filled in inside the block
+    spans = _task.get()
+    if spans is None and _profile is None:
+        yield attrs
+        return
+    start = time.time()
+    try:
+        yield attrs
+    finally:
+        record = {"name": name, "start": start, "end": time.time(), "pid": os.getpid(), **attrs}
+        if spans is not None:
+            spans.append(record)
+        else:
+            _profile.add([record])
+
+
+@contextmanager
+def collect(fn, args: tuple):
+    # the task's own span, named after its command, e.g. cmd_upgrade.do_task is "upgrade"
+    func = getattr(fn, "func", fn)
+    name = func.__module__.removeprefix("cmd_") if func.__module__.startswith("cmd_") else func.__name__
+    # every task takes its script as the only Path argument
+    script = next((x.stem for x in args if isinstance(x, Path)), "")
+    spans = []
+    token = _task.set(spans)
+    try:
+        with span(name, task=True):
+            yield spans
+    finally:
+        _task.reset(token)
+        for x in spans:
+            x.setdefault("script", script)
+
+
+def run_profiled(fn, *args) -> tuple[list[dict], object, Exception | None]:
+    # in a worker: (spans, result, error), the error is returned so the spans get back too
+    with collect(fn, args) as spans:
+        try:
+            result, error = fn(*args), None
+        except Exception as e:
+            result, error = None, e
+    # and whatever this worker recorded outside a task since the last one
+    with _profile.lock:
+        spans += _profile.spans
+        _profile.spans = []
+    return spans, result, error
+
+
+def unwrap_profiled(profile: Profile, future: Future, inner: Future):
+    if future.cancelled():
+        return
+    if inner.cancelled():
+        future.cancel()
+        return
+    if inner.exception() is not None:
+        future.set_exception(inner.exception())
+        return
+    spans, result, error = inner.result()
+    profile.add(spans)
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+def submit_profiled(profile: Profile, submit, fn, *args) -> Future:
+    # the future resolves to the task's result alone, its spans go to the profile
+    future = Future()
+    inner = submit(run_profiled, fn, *args)
+    inner.add_done_callback(partial(unwrap_profiled, profile, future))
+    future.add_done_callback(lambda x: x.cancelled() and inner.cancel())
+    return future
+
+
+async def run_profiled_async(profile: Profile, fn, *args):
+    try:
+        with collect(fn, args) as spans:
+            return await fn(*args)
+    finally:
+        profile.add(spans)
+
+
+def write_trace(profile: Profile, name: str = "trace.json") -> Path:
+    # Chrome trace event format, one lane per script in each process
+    lanes = {}
+    events = []
+    for x in profile.spans:
+        attrs = {k: v for k, v in x.items() if k not in ("name", "start", "end", "pid", "script", "task")}
+        events.append(
+            {
+                "name": x["name"],
+                "cat": x["script"],
+                "ph": "X",
+                "ts": x["start"] * 1e6,
+                "dur": (x["end"] - x["start"]) * 1e6,
+                "pid": x["pid"],
+                "tid": lanes.setdefault(x["script"], len(lanes)),
+                "args": attrs,
+            }
+        )
+    names = {(x["pid"], x["script"]) for x in profile.spans}
+    events += [{"name": "thread_name", "ph": "M", "pid": pid, "tid": lanes[script], "args": {"name": script}} for pid, script in names]
+    profile.path.mkdir(parents=True, exist_ok=True)
+    path = profile.path / name
+    with open(path, "wb") as f:
+        f.write(orjson.dumps({"traceEvents": events}))
+    return path
+
+
+def log_profile(profile: Profile):
+    profile.dump_cpu()
+    log_spans(profile)
+
+
+def log_spans(profile: Profile, trace: str = "trace.json"):
+    if len(profile.spans) == 0:
+        return
+
+    # seconds per step of each script, over every command of the run
+    scripts = {}
+    for x in sorted(profile.spans, key=lambda x: x["start"]):
+        row = scripts.setdefault(x["script"], {"total": 0.0, "bytes": 0})
+        key = "total" if x.get("task") else x["name"]
+        row[key] = row.get(key, 0.0) + x["end"] - x["start"]
+        row["bytes"] += x.get("bytes", 0)
+    rows = []
+    for script, row in scripts.items():
+        throughput = f"{row['bytes'] / row['download'] / 1e6:.1f}" if row.get("download") else ""
+        rows.append([script, f"{row['total']:.3f}", *[f"{row[x]:.3f}" if x in row else "" for x in COLUMNS], throughput])
+    log_title("Profile (seconds)")
+    log_table(["script", "total", *COLUMNS, "MB/s"], rows)
+    log_list([str(write_trace(profile, trace))])
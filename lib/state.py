@@ -0,0 +1,142 @@
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import orjson
+
+
+class JsonBackend:
+    """One pretty-printed `<name>.json` per script, the original cache layout."""
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    # pickled as a reference, the receiving process resolves it to its own backend
+    def __reduce__(self):
+        return (shared_backend, ("json", self.root))
+
+    def path(self, name: str) -> Path:
+        return self.root / f"{name}.json"
+
+    def load(self, name: str) -> dict:
+        path = self.path(name)
+        if not path.exists():
+            return {}
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+
+    def load_many(self, names: list[str]) -> dict[str, dict]:
+        return {x: self.load(x) for x in names}
+
+    def save(self, name: str, data: dict):
+        # write aside and rename, readers never see a partial file
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self.path(name)
+        temp = path.with_suffix(f".{os.getpid()}")
+        with open(temp, "wb") as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        os.replace(temp, path)
+
+    def save_many(self, items: dict[str, dict]):
+        for name, data in items.items():
+            self.save(name, data)
+
+    def names(self) -> list[str]:
+        return [x.stem for x in self.root.glob("*.json")]
+
+
+class SqliteBackend:
+    """All script states in one SQLite database in WAL mode.
+
+    The connection is opened lazily and never pickled; a backend sent to a worker
+    process resolves to that worker's own backend, which opens one connection for all
+    the tasks it runs.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._conn = None
+
+    def __reduce__(self):
+        return (shared_backend, ("sqlite", self.path.parent))
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            created = not self.path.exists()
+            self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS state (name TEXT PRIMARY KEY, data BLOB NOT NULL, updated_at REAL NOT NULL)")
+            if created:
+                self.migrate(JsonBackend(self.path.parent))
+        return self._conn
+
+    def load(self, name: str) -> dict:
+        row = self.conn.execute("SELECT data FROM state WHERE name = ?", (name,)).fetchone()
+        return orjson.loads(row[0]) if row is not None else {}
+
+    def load_many(self, names: list[str]) -> dict[str, dict]:
+        items = {x: {} for x in names}
+        # stay below the default bound parameter limit
+        for i in range(0, len(names), 500):
+            chunk = names[i : i + 500]
+            query = f"SELECT name, data FROM state WHERE name IN ({','.join('?' * len(chunk))})"
+            for name, data in self.conn.execute(query, chunk):
+                items[name] = orjson.loads(data)
+        return items
+
+    def save(self, name: str, data: dict):
+        self.save_many({name: data})
+
+    def save_many(self, items: dict[str, dict]):
+        now = time.time()
+        with self.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO state (name, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                [(name, orjson.dumps(data), now) for name, data in items.items()],
+            )
+
+    def names(self) -> list[str]:
+        return [x[0] for x in self.conn.execute("SELECT name FROM state")]
+
+    @contextmanager
+    def transaction(self):
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def migrate(self, source: JsonBackend) -> int:
+        # import existing cache/<script>.json files
+        names = source.names()
+        if len(names) > 0:
+            self.save_many(source.load_many(names))
+        return len(names)
+
+
+BACKENDS = {
+    "json": lambda root: JsonBackend(root),
+    "sqlite": lambda root: SqliteBackend(root / "state.db"),
+}
+_backends = {}
+
+
+def shared_backend(kind: str, root: Path) -> JsonBackend | SqliteBackend:
+    # one backend per process, never share a connection across fork
+    key = (os.getpid(), kind, root)
+    if key not in _backends:
+        _backends[key] = BACKENDS[kind](root)
+    return _backends[key]
+
+
+def open_backend(config: dict) -> JsonBackend | SqliteBackend:
+    return shared_backend(config.get("state", {}).get("backend", "json"), Path(config["path"]["home"]) / "cache")
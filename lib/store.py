@@ -0,0 +1,84 @@
+import hashlib
+import mmap
+import os
+import shutil
+from pathlib import Path
+
+import orjson
+
+
+def file_digest(path: Path) -> "hashlib._Hash":
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256")
+
+
+def mmap_digest(path: Path) -> str:
+    # one hash call over the mapped file, which releases the GIL for its whole length
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.sha256().hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            return hashlib.sha256(m).hexdigest()
+
+
+class IntegrityError(Exception):
+    """A transfer or a stored file that does not match its expected size or digest."""
+
+
+class ArtifactStore:
+    """Content-addressed copies of downloaded assets, shared by every script.
+
+    Blobs live at `<data>/.store/sha256/<xx>/<digest>` and are hardlinked into the version
+    dirs. `sources/` remembers which digest (and ETag) an asset url last resolved to.
+    """
+
+    def __init__(self, config: dict):
+        self.root = Path(config["path"]["data"]) / ".store"
+
+    def blob(self, digest: str) -> Path:
+        return self.root / "sha256" / digest[:2] / digest
+
+    def source(self, url: str) -> Path:
+        return self.root / "sources" / f"{hashlib.sha256(url.encode()).hexdigest()}.json"
+
+    def find(self, digest: str | None) -> Path | None:
+        if digest is None:
+            return None
+        blob = self.blob(digest)
+        return blob if blob.exists() else None
+
+    def lookup(self, url: str) -> tuple[Path | None, str | None]:
+        # (blob, etag) last stored for this url
+        return self.lookup_source(self.source(url))
+
+    def lookup_source(self, path: Path) -> tuple[Path | None, str | None]:
+        if not path.exists():
+            return None, None
+        with open(path, "rb") as f:
+            data = orjson.loads(f.read())
+        return self.find(data["digest"]), data["etag"]
+
+    def add(self, path: Path, digest: str, url: str, etag: str | None) -> Path:
+        # move a finished download in, or drop it if the content is already stored
+        blob = self.blob(digest)
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        if blob.exists():
+            path.unlink()
+        else:
+            os.replace(path, blob)
+
+        source = self.source(url)
+        source.parent.mkdir(parents=True, exist_ok=True)
+        temp = source.with_suffix(f".{os.getpid()}")
+        with open(temp, "wb") as f:
+            f.write(orjson.dumps({"digest": digest, "etag": etag}))
+        os.replace(temp, source)
+        return blob
+
+    def link(self, blob: Path, target: Path):
+        target.unlink(missing_ok=True)
+        try:
+            os.link(blob, target)
+        except OSError:
+            # other filesystem or no hardlink support
+            shutil.copy2(blob, target)
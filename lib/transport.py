@@ -0,0 +1,91 @@
+import importlib.util
+import multiprocessing
+
+import httpx
+
+# counters of TransportStats
+REQUESTS, CONNECTIONS, HANDSHAKES, HTTP2 = range(4)
+
+
+def transport_limits(config: dict) -> httpx.Limits:
+    http = config.get("http", {})
+    return httpx.Limits(
+        max_connections=http.get("max_connections", 20),
+        max_keepalive_connections=http.get("max_keepalive_connections", 10),
+        keepalive_expiry=http.get("keepalive_expiry", 30.0),
+    )
+
+
+def http2_enabled(config: dict) -> bool:
+    # HTTP/2 needs the optional h2 package (httpx[http2]), HTTP/1.1 otherwise
+    return config.get("http", {}).get("http2", True) and importlib.util.find_spec("h2") is not None
+
+
+class TransportStats:
+    """Requests and new connections of every client of a run, in shared memory.
+
+    Counted from httpcore's trace events, so a request that reuses a pooled connection
+    adds a request but no connection or TLS handshake.
+    """
+
+    def __init__(self):
+        self.counters = multiprocessing.RawArray("q", 4)
+        self.lock = multiprocessing.Lock()
+
+    def add(self, counter: int):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def trace(self, event: str, info: dict):
+        if event == "connection.connect_tcp.complete":
+            self.add(CONNECTIONS)
+        elif event == "connection.start_tls.complete":
+            self.add(HANDSHAKES)
+        elif event == "http11.send_request_headers.started":
+            self.add(REQUESTS)
+        elif event == "http2.send_request_headers.started":
+            self.add(REQUESTS)
+            self.add(HTTP2)
+
+    async def trace_async(self, event: str, info: dict):
+        self.trace(event, info)
+
+    def summary(self) -> str | None:
+        requests, connections, handshakes, http2 = self.counters[:]
+        if requests == 0:
+            return None
+        return f"{requests} requests over {connections} connections ({handshakes} TLS handshakes, {http2} over HTTP/2)"
+
+
+class TracedTransport(httpx.HTTPTransport):
+    def __init__(self, stats: TransportStats | None, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if self.stats is not None:
+            request.extensions["trace"] = self.stats.trace
+        return super().handle_request(request)
+
+
+class AsyncTracedTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, stats: TransportStats | None, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self.stats is not None:
+            request.extensions["trace"] = self.stats.trace_async
+        return await super().handle_async_request(request)
+
+
+def make_client(config: dict, headers: dict, timeout: httpx.Timeout, stats: TransportStats | None = None) -> httpx.Client:
+    # one pooled client per process, kept for every task and command of the run
+    transport = TracedTransport(stats, http2=http2_enabled(config), limits=transport_limits(config))
+    return httpx.Client(headers=headers, timeout=timeout, transport=transport)
+
+
+def make_async_client(config: dict, headers: dict, timeout: httpx.Timeout, stats: TransportStats | None = None) -> httpx.AsyncClient:
+    # one pooled client for every coroutine of the async engine
+    transport = AsyncTracedTransport(stats, http2=http2_enabled(config), limits=transport_limits(config))
+    return httpx.AsyncClient(headers=headers, timeout=timeout, transport=transport)
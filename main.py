@@ -1,47 +1,69 @@
 import argparse
-import importlib.util
 import os
-import subprocess
 import sys
 import time
-from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-import tomlkit
+from lib.discover import find_scripts
 
-from cmd_install import do_install
-from cmd_update import do_update
-from cmd_upgrade import do_upgrade
-from lib.log import LogLevel, console, log, log_error, log_list, log_title
+# only the standard library is imported up front, each command imports what it needs
+# when it runs, so `list` starts without rich, httpx or tomlkit
+
+ENGINES = ("process", "async")
 
 parser = argparse.ArgumentParser()
 parser.add_argument("-c", "--config", type=str, default=None, help="config file path")
-parser.add_argument("command", type=str, help="command to run")
+parser.add_argument("-e", "--engine", type=str, default=None, choices=ENGINES, help="download engine, overrides [worker] engine")
+parser.add_argument("-k", "--keep-going", action="store_true", help="finish the other scripts when one fails, overrides [worker] keep_going")
+parser.add_argument("-o", "--output", type=str, default="rich", choices=("rich", "json", "ndjson"), help="how update/install/upgrade/sync/daemon report their results")
+parser.add_argument("--profile", action="store_true", help="print a timing table per script and write a Chrome trace")
+parser.add_argument("--profile-cpu", action="store_true", help="with --profile, also dump cProfile stats of every process")
+parser.add_argument("command", type=str, help="command to run, chain commands with a comma, e.g. update,upgrade")
 parser.add_argument("args", nargs=argparse.REMAINDER, help="args for command")
 args = parser.parse_args()
 
-if (args.config is None) or (not Path(args.config).exists):
+# commands that write the config back, these keep its formatting through tomlkit
+WRITE_COMMANDS = ("enable", "disable")
+
+if (args.config is None) or (not Path(args.config).exists()):
+    from lib.log import log
+
     log.error("Config file not found")
     sys.exit(1)
-with open(args.config, "r", encoding="utf8") as f:
-    config = tomlkit.parse(f.read())
+if any(x in WRITE_COMMANDS for x in args.command.split(",")):
+    import tomlkit
+
+    with open(args.config, "r", encoding="utf8") as f:
+        config = tomlkit.parse(f.read())
+else:
+    import tomllib
+
+    with open(args.config, "rb") as f:
+        config = tomllib.load(f)
 
 HOME = Path(config["path"]["home"]).resolve()
+ENGINE = args.engine or config["worker"].get("engine", "process")
+KEEP_GOING = args.keep_going or config["worker"].get("keep_going", False)
+PROFILE, PROFILE_CPU = args.profile, args.profile_cpu
+OUTPUT = args.output
 
 
 def save_config(config: dict):
+    import tomlkit
+
     with open(args.config, "w", encoding="utf8") as f:
         tomlkit.dump(config, f)
 
 
 def _enable(config: dict, scripts: list[Path], args: list[str]):
+    from lib.log import log, log_list, log_title
+
     enabled = []
     if args == []:
         enabled = [x.stem for x in scripts]
     else:
         for script in args:
-            path = HOME / "scripts" / f"{script}.py"
-            if not path.exists():
+            if script not in [x.stem for x in scripts]:
                 log.warning(f"Script {script} not found")
                 continue
             enabled.append(script)
@@ -57,6 +79,8 @@ def _enable(config: dict, scripts: list[Path], args: list[str]):
 
 
 def _disable(config: dict, scripts: list[Path], args: list[str]):
+    from lib.log import log, log_list, log_title
+
     disabled = []
     if args == []:
         disabled = config["script"]["enabled"]
@@ -76,34 +100,97 @@ def _disable(config: dict, scripts: list[Path], args: list[str]):
         sys.exit(0)
 
 
+# the styles of log_title and _list as SGR codes, for output without rich
+STYLES = {"title": "96;1", "enabled": "92", "disabled": "38;5;210"}
+
+
+def _print(text: str, style: str):
+    if sys.stdout.isatty() and "NO_COLOR" not in os.environ:
+        text = f"\x1b[{STYLES[style]}m{text}\x1b[0m"
+    print(text)
+
+
 def _list(scripts: list[Path], config: dict, args: list[str]):
-    log_title("Available scripts")
+    _print("\n> Available scripts", "title")
     for script in scripts:
         item = script.stem
         if item in config["script"]["enabled"]:
-            console.print(f"+ {item}", style="bright_green")
+            _print(f"+ {item}", "enabled")
         else:
-            console.print(f"- {item}", style="light_coral")
+            _print(f"- {item}", "disabled")
 
 
-def main(command: str, args: list[str]):
-    scripts = [*(HOME / "scripts").glob("**/*.py")]
-    enabled_scripts = [x for x in scripts if x.stem in config["script"]["enabled"]]
+POOL_COMMANDS = ("update", "install", "upgrade", "sync", "daemon")
 
+
+def worker_count(command: str) -> int:
+    from cmd_sync import sync_limits
+
+    if command == "sync":
+        return sum(sync_limits(config))
+    # the daemon runs update and upgrade in the same pool
+    if command == "daemon":
+        return max(config["worker"]["update"], config["worker"]["upgrade"])
+    return config["worker"][command]
+
+
+def run(command: str, scripts: list[Path], enabled_scripts: list[Path], args: list[str], pool) -> list[Exception]:
     if command == "update":
-        do_update(enabled_scripts, config, args)
+        from cmd_update import do_update
+
+        return do_update(enabled_scripts, config, args, ENGINE, pool, KEEP_GOING)
     elif command == "install":
+        from cmd_install import do_install
+
         if len(args) == 0:
             filtered_scripts = enabled_scripts
         else:
             filtered_scripts = [x for x in enabled_scripts if x.stem in args]
-        do_install(filtered_scripts, config, args)
+        return do_install(filtered_scripts, config, args, ENGINE, pool, KEEP_GOING)
     elif command == "upgrade":
+        from cmd_upgrade import do_upgrade
+
         if len(args) == 0:
             filtered_scripts = enabled_scripts
         else:
             filtered_scripts = [x for x in enabled_scripts if x.stem in args]
-        do_upgrade(filtered_scripts, config, args)
+        return do_upgrade(filtered_scripts, config, args, ENGINE, pool, KEEP_GOING)
+    elif command == "sync":
+        from cmd_sync import do_sync
+
+        if len(args) == 0:
+            filtered_scripts = enabled_scripts
+        else:
+            filtered_scripts = [x for x in enabled_scripts if x.stem in args]
+        return do_sync(filtered_scripts, config, args, ENGINE, pool, KEEP_GOING)
+    elif command == "daemon":
+        from cmd_daemon import do_daemon
+
+        if len(args) == 0:
+            filtered_scripts = enabled_scripts
+        else:
+            filtered_scripts = [x for x in enabled_scripts if x.stem in args]
+        do_daemon(filtered_scripts, config, args, ENGINE, pool, PROFILE)
+    elif command == "gc":
+        from cmd_gc import do_gc
+
+        if len(args) == 0:
+            filtered_scripts = enabled_scripts
+        else:
+            filtered_scripts = [x for x in enabled_scripts if x.stem in args]
+        do_gc(filtered_scripts, config, args)
+    elif command == "rollback":
+        from cmd_rollback import do_rollback
+
+        do_rollback([x for x in enabled_scripts if x.stem in args], config, args)
+    elif command == "verify":
+        from cmd_verify import do_verify
+
+        if len(args) == 0:
+            filtered_scripts = enabled_scripts
+        else:
+            filtered_scripts = [x for x in enabled_scripts if x.stem in args]
+        do_verify(filtered_scripts, config, args)
     elif command == "enable":
         _enable(config, scripts, args)
     elif command == "disable":
@@ -111,8 +198,70 @@ def main(command: str, args: list[str]):
     elif command == "list":
         _list(scripts, config, args)
     else:
+        from lib.log import log
+
         log.error(f"Command {command} not found")
         sys.exit(1)
+    return []
+
+
+def main(command: str, args: list[str]):
+    scripts = find_scripts(HOME / "scripts")
+    enabled_scripts = [x for x in scripts if x.stem in config["script"]["enabled"]]
+
+    # commands can be chained, e.g. `update,upgrade`, and share one worker pool
+    commands = command.split(",")
+    pool_commands = [x for x in commands if x in POOL_COMMANDS]
+    if len(pool_commands) == 0:
+        for command in commands:
+            run(command, scripts, enabled_scripts, args, None)
+        return
+
+    from lib.executor import WorkerPool
+    from lib.helper import load_script
+    from lib.log import log_list, log_title
+    from lib.report import start_report
+    from lib.spans import log_profile, start_profile
+
+    # the report takes durations and bytes from the spans, so it turns them on as well
+    report = start_report(OUTPUT, config.get("metrics", {}).get("textfile"))
+    profile = None
+    if PROFILE or report is not None:
+        profile = start_profile(HOME / "profile" / time.strftime("%Y%m%d-%H%M%S"), PROFILE_CPU)
+
+    # parse manifests before any worker is started
+    for script in enabled_scripts:
+        if script.suffix == ".toml":
+            load_script(script)
+    max_workers = max(worker_count(x) for x in pool_commands)
+    errors, code = [], 1
+    try:
+        with WorkerPool(config, max_workers, enabled_scripts) as pool:
+            for command in commands:
+                errors += run(command, scripts, enabled_scripts, args, pool)
+                if report is not None:
+                    report.flush(profile.spans)
+
+            # connection reuse across all commands
+            summary = pool.stats.summary()
+            if summary is not None:
+                log_title("Connections")
+                log_list([summary])
+
+        # scripts failed in keep-going mode
+        code = 1 if len(errors) > 0 else 0
+    except SystemExit as e:
+        code = e.code
+        raise
+    finally:
+        # after the pool shut down, so every worker has dumped its cProfile stats
+        if PROFILE:
+            log_profile(profile)
+        # the daemon finishes the report of every cycle itself, only what it did not is left
+        if report is not None and ("daemon" not in commands or len(report.results) > 0):
+            report.finish(profile.spans, code)
+    if code != 0:
+        sys.exit(code)
 
 
 if __name__ == "__main__":
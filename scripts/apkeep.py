@@ -12,7 +12,7 @@ from lib.helper import client, grant, single_install_move, single_uninstall, sin
 from lib.log import LogLevel, console, log, log_error, log_list, log_title
 
 
-def update(_p_stats: dict, task_id: int, script: Path, config: dict, cache: dict):
+def update_args(script: Path, config: dict) -> dict:
     github_repo = "EFForg/apkeep"
     args = {
         "url": f"https://api.github.com/repos/{github_repo}/releases/latest",
@@ -27,21 +27,31 @@ def update(_p_stats: dict, task_id: int, script: Path, config: dict, cache: dict
         },
     }
     args["regex_asset"] = re.compile(asset_mapping[platform.system()][platform.machine()])
+    return args
 
-    single_update(_p_stats, task_id, script, config, cache, args)
 
+def update(_p_stats: dict, task_id: int, script: Path, config: dict, cache: dict):
+    single_update(_p_stats, task_id, script, config, cache, update_args(script, config))
 
-def install(_p_stats: dict, task_id: int, script: Path, config: dict, cache: dict):
-    args = {
+
+def install_args(script: Path, config: dict) -> dict:
+    return {
         "save_name": f"{script.stem}" + (".exe" if platform.system() == "Windows" else ""),
     }
-    single_install_move(_p_stats, task_id, script, config, cache, args)
+
+
+def post_install(script: Path, config: dict):
     # permissions
     if platform.system() == "Linux":
         path_app = Path(config["path"]["data"]) / script.stem
         grant(path_app.glob("**/apkeep"), mode=0o755)
 
 
+def install(_p_stats: dict, task_id: int, script: Path, config: dict, cache: dict):
+    single_install_move(_p_stats, task_id, script, config, cache, install_args(script, config))
+    post_install(script, config)
+
+
 def uninstall(_p_stats: dict, task_id: int, script: Path, config: dict, cache: dict):
     single_uninstall(_p_stats, task_id, script, config, cache)
 